@@ -0,0 +1,322 @@
+"""Offline benchmark suite: preprocessing, inference, file scoring, model loading and diary I/O.
+
+Run: python benchmark_suite.py --sizes 1000 10000 --output benchmark_results.json --baseline benchmark_baseline.json
+Record a baseline on the reference machine first with --save-baseline; later runs exit with status 1 when a case
+regresses past the thresholds.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import pickle
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SYNTHETIC_WORDS = (
+    "i feel so happy today and loved by everyone around me but a little scared about tomorrow "
+    "angry at the traffic sad that the weekend is over surprised by the news http://example.com <b>really</b> "
+    "wonderful terrible amazing lonely anxious excited furious grateful nervous shocked calm 2024 !!! :)"
+).split()
+
+
+def make_texts(n, source, seed=42, sample_path=os.path.join(HERE, 'prediction_results.csv')):
+    """n synthetic sentences, or n texts sampled with replacement from a CSV's 'text' column"""
+    rng = random.Random(seed)
+    if source == 'sampled':
+        with open(sample_path, 'r', encoding='utf-8') as f:
+            pool = [row['text'] for row in csv.DictReader(f) if row.get('text')]
+        return [rng.choice(pool) for _ in range(n)]
+    return [' '.join(rng.choice(SYNTHETIC_WORDS) for _ in range(rng.randint(5, 40))) for _ in range(n)]
+
+
+def _percentiles(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {'p50_ms': float(np.percentile(ms, 50)), 'p95_ms': float(np.percentile(ms, 95)),
+            'p99_ms': float(np.percentile(ms, 99))}
+
+
+def _peak_memory_mb(fn):
+    """Peak Python/NumPy allocation of one extra call, measured separately so tracing does not skew timings"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def measure_per_item(fn, items):
+    """Time fn(item) for each item: throughput and per-call latency percentiles"""
+    latencies = []
+    start_time = time.perf_counter()
+    for item in items:
+        call_start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start_time
+    return {'items': len(items), 'throughput_per_s': len(items) / elapsed, **_percentiles(latencies)}
+
+
+def measure_repeated(fn, n_items, repeats, setup=None):
+    """Time whole calls (a batch, a file, a load) repeats times; throughput uses the median call"""
+    latencies = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        call_start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - call_start)
+    return {'items': n_items, 'repeats': repeats,
+            'throughput_per_s': n_items / float(np.median(latencies)), **_percentiles(latencies)}
+
+
+def benchmark_text_cases(model, emotion_mapping, texts, workdir, repeats):
+    from text_preprocessing import LemmaTable, PreprocessingCache, clean_text, preprocess_text
+    from emotion_predictor import EmotionPredictor
+    cases = {}
+    cases['clean_text'] = (lambda: measure_per_item(clean_text, texts),
+                           lambda: [clean_text(text) for text in texts])
+
+    def preprocess_cold():
+        cache = PreprocessingCache(max_size=len(texts) + 1)
+        return measure_per_item(lambda text: preprocess_text(text, cache), texts)
+    cases['preprocess_text'] = (
+        preprocess_cold,
+        lambda: [preprocess_text(text, PreprocessingCache()) for text in texts])
+
+    # Built on first use, outside the timed calls, so a missing NLTK corpus fails only this case
+    lemma_tables = []
+    def lemma_table():
+        if not lemma_tables:
+            lemma_tables.append(LemmaTable.build(texts))
+        return lemma_tables[0]
+
+    def preprocess_lemma_table_cold():
+        cache, table = PreprocessingCache(max_size=len(texts) + 1), lemma_table()
+        return measure_per_item(lambda text: preprocess_text(text, cache, table), texts)
+    cases['preprocess_text_lemma_table'] = (
+        preprocess_lemma_table_cold,
+        lambda: [preprocess_text(text, PreprocessingCache(), lemma_table()) for text in texts])
+
+    def fresh_predictor():
+        return EmotionPredictor(model, emotion_mapping, cache=PreprocessingCache(len(texts) + 1))
+
+    predictor = fresh_predictor()
+    cases['predict'] = (lambda: measure_per_item(predictor.predict, texts),
+                        lambda: [fresh_predictor().predict(text) for text in texts])
+
+    state = {}
+    def reset_predictor():
+        state['predictor'] = fresh_predictor()
+    cases['predict_batch'] = (
+        lambda: measure_repeated(lambda: state['predictor'].predict_batch(texts), len(texts), repeats, reset_predictor),
+        lambda: fresh_predictor().predict_batch(texts))
+
+    input_path = os.path.join(workdir, f'texts_{len(texts)}.csv')
+    with open(input_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['text'])
+        writer.writerows([text] for text in texts)
+    cases['predict_from_file'] = (
+        lambda: measure_repeated(lambda: state['predictor'].predict_from_file(input_path), len(texts), repeats,
+                                 reset_predictor),
+        lambda: fresh_predictor().predict_from_file(input_path))
+    output_path = os.path.join(workdir, 'streamed.csv')
+    cases['predict_file_streaming'] = (
+        lambda: measure_repeated(lambda: state['predictor'].predict_file_streaming(input_path, output_path),
+                                 len(texts), repeats, reset_predictor),
+        lambda: fresh_predictor().predict_file_streaming(input_path, output_path))
+    return cases
+
+
+def benchmark_model_load(repeats):
+    from emotion_inference_engine import load_compact_model
+    model_path = os.path.join(HERE, 'emotion_model.pkl')
+    compact_dir = os.path.join(HERE, 'emotion_model_compact')
+
+    def load_pickle():
+        with open(model_path, 'rb') as f:
+            return pickle.load(f)
+    return {
+        'model_load_pickle': (lambda: measure_repeated(load_pickle, 1, repeats), load_pickle),
+        'model_load_compact': (lambda: measure_repeated(lambda: load_compact_model(compact_dir), 1, repeats),
+                               lambda: load_compact_model(compact_dir, mmap=False))
+    }
+
+
+def benchmark_diary_cases(size, workdir, repeats, backends=('sqlite', 'csv')):
+    """The store calls EmotionDiaryApp makes: load_diary_store opens and counts, save_to_diary adds one entry"""
+    from diary_storage import open_diary_store, _synthetic_entries
+    extensions = {'sqlite': '.db', 'csv': '.csv', 'journal': '.jsonl'}
+    cases = {}
+    for backend in backends:
+        path = os.path.join(workdir, f'diary_{size}{extensions[backend]}')
+        store = open_diary_store(path)
+        store.add_many(_synthetic_entries(size))
+        store.close()
+
+        def load(path=path):
+            store = open_diary_store(path)
+            store.count()
+            store.close()
+
+        def save(path=path):
+            store = open_diary_store(path)
+            new_entries = _synthetic_entries(repeats)
+            result = measure_per_item(store.add, new_entries)
+            for entry_id in [entry['id'] for entry in store.page_before(None, repeats)]:
+                store.delete(entry_id)
+            store.close()
+            return result
+
+        cases[f'diary_load_{backend}'] = (lambda load=load: measure_repeated(load, size, repeats), load)
+        cases[f'diary_save_{backend}'] = (save, lambda path=path: save(path))
+    return cases
+
+
+def run_suite(sizes, sources, repeats=5, memory=True):
+    """Run every case at every size; cases that cannot run here record the error instead of aborting the suite"""
+    import sklearn
+    results = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'sizes': list(sizes),
+            'sources': list(sources),
+            'repeats': repeats
+        },
+        'cases': {}
+    }
+
+    def record(key, case):
+        run, run_once = case
+        print(f"Running {key}...")
+        try:
+            result = run()
+            if memory:
+                result['peak_memory_mb'] = _peak_memory_mb(run_once)
+        except Exception as e:
+            # NLTK's LookupError spans a boxed, multi-line message; one line of it is enough for the JSON
+            result = {'error': f"{type(e).__name__}: {' '.join(str(e).replace('*', ' ').split())[:200]}"}
+            print(f"  {key} failed: {result['error']}")
+        results['cases'][key] = result
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for key, case in benchmark_model_load(repeats).items():
+            record(key, case)
+
+        try:
+            with open(os.path.join(HERE, 'emotion_model.pkl'), 'rb') as f:
+                model = pickle.load(f)
+            with open(os.path.join(HERE, 'emotion_mapping.pkl'), 'rb') as f:
+                emotion_mapping = pickle.load(f)
+        except Exception as e:
+            model = None
+            results['cases']['model'] = {'error': f"{type(e).__name__}: {e}"}
+            print(f"Text cases skipped, could not load the model: {e}")
+
+        for size in sizes:
+            if model is not None:
+                for source in sources:
+                    texts = make_texts(size, source)
+                    for name, case in benchmark_text_cases(model, emotion_mapping, texts, workdir, repeats).items():
+                        record(f"{name}[{source},{size}]", case)
+            for name, case in benchmark_diary_cases(size, workdir, repeats).items():
+                record(f"{name}[{size}]", case)
+    return results
+
+
+def compare_to_baseline(results, baseline, throughput_threshold=0.15, latency_threshold=0.25, memory_threshold=0.25,
+                        min_latency_delta_ms=0.05):
+    """Return (rows, regressions) comparing each case present in both runs; a case that ran in the
+    baseline and now fails is a regression"""
+    rows, regressions = [], []
+    # Sub-millisecond p99s jitter by more than the relative threshold, so tiny absolute changes are ignored
+    checks = (
+        ('throughput_per_s', lambda new, old: new < old * (1 - throughput_threshold)),
+        ('p99_ms', lambda new, old: new > old * (1 + latency_threshold) and new - old > min_latency_delta_ms),
+        ('peak_memory_mb', lambda new, old: new > old * (1 + memory_threshold))
+    )
+    for key, current in results['cases'].items():
+        previous = baseline.get('cases', {}).get(key)
+        if previous is None or 'error' in previous:
+            continue
+        if 'error' in current:
+            row = {'case': key, 'metric': 'error', 'baseline': None, 'current': current['error'], 'change': None,
+                   'regression': True}
+            rows.append(row)
+            regressions.append(row)
+            continue
+        for metric, regressed in checks:
+            if metric not in current or metric not in previous:
+                continue
+            new, old = current[metric], previous[metric]
+            change = (new - old) / old if old else 0.0
+            row = {'case': key, 'metric': metric, 'baseline': old, 'current': new, 'change': change,
+                   'regression': bool(regressed(new, old))}
+            rows.append(row)
+            if row['regression']:
+                regressions.append(row)
+    return rows, regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark suite with baseline regression checks")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--sources', nargs='+', default=['synthetic', 'sampled'], choices=['synthetic', 'sampled'])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc peak memory pass")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--throughput-threshold', type=float, default=0.15)
+    parser.add_argument('--latency-threshold', type=float, default=0.25)
+    parser.add_argument('--memory-threshold', type=float, default=0.25)
+    parser.add_argument('--min-latency-delta-ms', type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, args.sources, args.repeats, memory=not args.no_memory)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    print(f"\n{'Case':<45} {'items/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'peak MB':>9}")
+    for key, result in results['cases'].items():
+        if 'error' in result:
+            print(f"{key:<45} error: {result['error']}")
+            continue
+        print(f"{key:<45} {result['throughput_per_s']:>12.1f} {result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f} "
+              f"{result.get('peak_memory_mb', float('nan')):>9.1f}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressions = compare_to_baseline(results, baseline, args.throughput_threshold,
+                                                args.latency_threshold, args.memory_threshold,
+                                                args.min_latency_delta_ms)
+        print(f"\nCompared with baseline from {baseline['meta']['timestamp']} ({len(rows)} metrics)")
+        for row in regressions:
+            if row['metric'] == 'error':
+                print(f"REGRESSION {row['case']} fails now: {row['current']}")
+                continue
+            print(f"REGRESSION {row['case']} {row['metric']}: {row['baseline']:.4g} -> {row['current']:.4g} "
+                  f"({row['change']:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
@@ -0,0 +1,838 @@
+"""Diary storage backends: append-only journal and SQLite, behind one small repository interface"""
+import os
+import re
+import csv
+import json
+import time
+import sqlite3
+import bisect
+import heapq
+import argparse
+import tempfile
+from collections import Counter
+from datetime import datetime
+
+DIARY_FIELDS = ["text", "emotion", "date"]
+TOKEN_PATTERN = re.compile(r'\w+')
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# FTS5 tokenizer matching tokenize_keywords: keeps diacritics and treats '_' as a word character like \w
+FTS_TOKENIZE = "unicode61 remove_diacritics 0 tokenchars '_'"
+ACCEPTED_DATE_FORMATS = (DATE_FORMAT, "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def tokenize_keywords(text):
+    """Lower-cased word tokens used for both indexing and keyword queries"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def normalize_date(date):
+    """Rewrite a date as zero-padded 'YYYY-MM-DD HH:MM:SS' so string ranges, Python rollup buckets and
+    SQLite strftime all agree; dates that do not exist (e.g. 2024-02-30) raise ValueError"""
+    text = str(date).strip()
+    for date_format in ACCEPTED_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime(DATE_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid diary date: {date!r}")
+
+
+def normalize_fields(fields):
+    """Copy of an entry or update dict with its date, if any, normalized"""
+    if 'date' not in fields:
+        return dict(fields)
+    return dict(fields, date=normalize_date(fields['date']))
+
+
+def date_bounds(date_from=None, date_to=None):
+    """Turn inclusive YYYY-MM-DD[ HH:MM:SS] bounds into comparable date-string limits"""
+    lower = date_from or None
+    upper = None
+    if date_to:
+        upper = date_to if len(date_to) > 10 else date_to + " 23:59:59"
+    return lower, upper
+
+
+def entry_matches(entry, emotion=None, date_from=None, date_to=None, keyword=None):
+    """Check one entry against the search filters (used by the unindexed backends)"""
+    lower, upper = date_bounds(date_from, date_to)
+    if emotion and entry['emotion'] != emotion:
+        return False
+    if lower and entry['date'] < lower:
+        return False
+    if upper and entry['date'] > upper:
+        return False
+    if keyword:
+        entry_tokens = set(tokenize_keywords(entry['text']))
+        if not all(token in entry_tokens for token in tokenize_keywords(keyword)):
+            return False
+    return True
+
+
+ROLLUP_GRANULARITIES = ('day', 'week', 'month')
+
+
+def rollup_bucket(date, granularity):
+    """Bucket a 'YYYY-MM-DD HH:MM:SS' date by day, Monday-based week (YYYY-Www) or month"""
+    if granularity == 'day':
+        return date[:10]
+    if granularity == 'month':
+        return date[:7]
+    try:
+        return datetime.strptime(date[:10], "%Y-%m-%d").strftime("%Y-W%W")
+    except ValueError:
+        return 'unknown'
+
+
+def compute_rollups(entries, granularity):
+    """Full recomputation of {(bucket, emotion): count}; the reference for the incremental rollups"""
+    return dict(Counter((rollup_bucket(entry['date'], granularity), entry['emotion']) for entry in entries))
+
+
+def verify_rollups(store):
+    """Compare the store's incrementally maintained rollups with a full recomputation"""
+    entries = store.all_entries()
+    mismatches = {}
+    for granularity in ROLLUP_GRANULARITIES:
+        expected = compute_rollups(entries, granularity)
+        actual = store.emotion_rollups(granularity)
+        diff = {key: (actual.get(key, 0), expected.get(key, 0))
+                for key in set(expected) | set(actual) if actual.get(key, 0) != expected.get(key, 0)}
+        if diff:
+            mismatches[granularity] = diff
+    return mismatches
+
+
+def summarize_rollups(rollups):
+    """Per-bucket rows of emotion counts, total, dominant emotion and change in total vs the previous bucket"""
+    emotions = sorted({emotion for _, emotion in rollups})
+    buckets = sorted({bucket for bucket, _ in rollups})
+    rows = []
+    previous_total = None
+    for bucket in buckets:
+        counts = {emotion: rollups.get((bucket, emotion), 0) for emotion in emotions}
+        total = sum(counts.values())
+        rows.append({
+            'bucket': bucket, **counts, 'total': total,
+            'dominant': max(counts, key=counts.get) if total else '',
+            'change': total - previous_total if previous_total is not None else 0
+        })
+        previous_total = total
+    return emotions, rows
+
+
+def export_rollup_summary(store, granularity, path):
+    """Write the per-bucket emotion summary to a CSV file"""
+    emotions, rows = summarize_rollups(store.emotion_rollups(granularity))
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['bucket', *emotions, 'total', 'dominant', 'change'])
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+
+class DiaryStore:
+    """Repository interface for diary entries; entries are dicts with id, text, emotion and date"""
+    def all_entries(self):
+        raise NotImplementedError
+
+    def add(self, entry):
+        """Store a new entry and return its id"""
+        raise NotImplementedError
+
+    def update(self, entry_id, fields):
+        raise NotImplementedError
+
+    def delete(self, entry_id):
+        raise NotImplementedError
+
+    def add_many(self, entries):
+        return [self.add(entry) for entry in entries]
+
+    def get(self, entry_id):
+        return next((entry for entry in self.all_entries() if entry['id'] == entry_id), None)
+
+    def page_before(self, before_id=None, limit=200):
+        """Return up to limit entries with id < before_id, newest first (keyset pagination)"""
+        entries = [entry for entry in self.all_entries() if before_id is None or entry['id'] < before_id]
+        return sorted(entries, key=lambda entry: entry['id'], reverse=True)[:limit]
+
+    def search(self, emotion=None, date_from=None, date_to=None, keyword=None, before_id=None, limit=200):
+        """Return up to limit matching entries with id < before_id, newest first"""
+        entries = [entry for entry in self.all_entries()
+                   if (before_id is None or entry['id'] < before_id)
+                   and entry_matches(entry, emotion, date_from, date_to, keyword)]
+        return sorted(entries, key=lambda entry: entry['id'], reverse=True)[:limit]
+
+    def iter_entries(self, page_size=1000):
+        """Yield every entry newest first, one page at a time"""
+        before_id = None
+        while True:
+            page = self.page_before(before_id, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            before_id = page[-1]['id']
+
+    def count(self):
+        return len(self.all_entries())
+
+    def emotion_rollups(self, granularity='day'):
+        """Return {(bucket, emotion): count}; unindexed backends recompute from all entries"""
+        return compute_rollups(self.all_entries(), granularity)
+
+    # Model scores: the model version, predicted emotion and probability vector each entry was last scored with.
+    # Editing an entry's text discards its score, so only new, edited or older-model entries are re-scored.
+    def get_score(self, entry_id):
+        raise NotImplementedError(f"{type(self).__name__} does not store model scores")
+
+    def iter_unscored(self, model_version, page_size=1000):
+        """Yield pages (oldest first) of entries without a score from model_version"""
+        raise NotImplementedError(f"{type(self).__name__} does not store model scores")
+
+    def count_unscored(self, model_version):
+        raise NotImplementedError(f"{type(self).__name__} does not store model scores")
+
+    def save_scores(self, scores, relabel=False):
+        """Store score dicts (id, text, model_version, emotion, probabilities); entries whose text
+        changed since they were read are skipped. relabel also sets each entry's emotion to the prediction."""
+        raise NotImplementedError(f"{type(self).__name__} does not store model scores")
+
+    def close(self):
+        pass
+
+
+class CsvDiaryStore(DiaryStore):
+    """Legacy layout: the whole CSV is rewritten on every change (kept for comparison and migration)"""
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        if os.path.exists(path):
+            self.entries = read_legacy_csv(path)
+        for entry_id, entry in enumerate(self.entries, start=1):
+            entry['id'] = entry_id
+        self.next_id = len(self.entries) + 1
+
+    def _rewrite(self):
+        with open(self.path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=DIARY_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.entries)
+
+    def all_entries(self):
+        return [dict(entry) for entry in self.entries]
+
+    def add(self, entry):
+        entry = dict(normalize_fields({k: entry[k] for k in DIARY_FIELDS}), id=self.next_id)
+        self.next_id += 1
+        self.entries.append(entry)
+        self._rewrite()
+        return entry['id']
+
+    def add_many(self, entries):
+        ids = []
+        for entry in entries:
+            ids.append(self.next_id)
+            self.entries.append(dict(normalize_fields({k: entry[k] for k in DIARY_FIELDS}), id=self.next_id))
+            self.next_id += 1
+        self._rewrite()
+        return ids
+
+    def update(self, entry_id, fields):
+        fields = normalize_fields({k: v for k, v in fields.items() if k in DIARY_FIELDS})
+        for entry in self.entries:
+            if entry['id'] == entry_id:
+                entry.update(fields)
+        self._rewrite()
+
+    def delete(self, entry_id):
+        self.entries = [entry for entry in self.entries if entry['id'] != entry_id]
+        self._rewrite()
+
+    def count(self):
+        return len(self.entries)
+
+
+class JournalDiaryStore(DiaryStore):
+    """Append-only JSON-lines journal of add/update/delete operations with periodic compaction"""
+    def __init__(self, path, compact_min_ops=1000, compact_ratio=2.0, fsync=False):
+        self.path = path
+        self.compact_min_ops = compact_min_ops
+        self.compact_ratio = compact_ratio
+        self.fsync = fsync
+        self.entries = {}
+        self.next_id = 1
+        self.journal_ops = 0
+        # Secondary indexes, maintained incrementally as operations are applied
+        self.token_index = {}
+        self.emotion_index = {}
+        self.date_index = []  # Sorted (date, id) pairs
+        self.rollups = {granularity: Counter() for granularity in ROLLUP_GRANULARITIES}
+        self.scores = {}
+        self._replay()
+        self.journal = open(path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Torn final line from a crash mid-append
+                valid_end += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._apply(record)
+                self.journal_ops += 1
+        if valid_end < os.path.getsize(self.path):
+            # Cut the torn line off, otherwise the next append would be glued onto it and lost on replay
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+            print(f"Discarded a partially written record at the end of {self.path}")
+
+    def _index(self, entry):
+        for token in set(tokenize_keywords(entry['text'])):
+            self.token_index.setdefault(token, set()).add(entry['id'])
+        self.emotion_index.setdefault(entry['emotion'], set()).add(entry['id'])
+        bisect.insort(self.date_index, (entry['date'], entry['id']))
+        for granularity, counts in self.rollups.items():
+            counts[(rollup_bucket(entry['date'], granularity), entry['emotion'])] += 1
+
+    def _unindex(self, entry):
+        for token in set(tokenize_keywords(entry['text'])):
+            ids = self.token_index.get(token)
+            if ids is not None:
+                ids.discard(entry['id'])
+                if not ids:
+                    del self.token_index[token]
+        self.emotion_index.get(entry['emotion'], set()).discard(entry['id'])
+        position = bisect.bisect_left(self.date_index, (entry['date'], entry['id']))
+        if position < len(self.date_index) and self.date_index[position] == (entry['date'], entry['id']):
+            del self.date_index[position]
+        for granularity, counts in self.rollups.items():
+            key = (rollup_bucket(entry['date'], granularity), entry['emotion'])
+            counts[key] -= 1
+            if counts[key] <= 0:
+                del counts[key]
+
+    def _apply(self, record):
+        op = record['op']
+        entry_id = record['id']
+        if op == 'add':
+            if entry_id in self.entries:
+                self._unindex(self.entries[entry_id])
+                self.scores.pop(entry_id, None)
+            self.entries[entry_id] = {'id': entry_id, **{k: record[k] for k in DIARY_FIELDS}}
+            self._index(self.entries[entry_id])
+            self.next_id = max(self.next_id, entry_id + 1)
+        elif op == 'update' and entry_id in self.entries:
+            self._unindex(self.entries[entry_id])
+            self.entries[entry_id].update(record['fields'])
+            self._index(self.entries[entry_id])
+            if 'text' in record['fields']:
+                self.scores.pop(entry_id, None)
+        elif op == 'delete' and entry_id in self.entries:
+            self._unindex(self.entries.pop(entry_id))
+            self.scores.pop(entry_id, None)
+        elif op == 'score' and entry_id in self.entries:
+            self.scores[entry_id] = {k: record[k] for k in ('model_version', 'emotion', 'probabilities')}
+
+    def _append(self, records):
+        for record in records:
+            self._apply(record)
+        self.journal.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.journal_ops += len(records)
+        live_records = len(self.entries) + len(self.scores)
+        if self.journal_ops >= self.compact_min_ops and self.journal_ops > self.compact_ratio * max(live_records, 1):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the journal as one add per live entry, atomically replacing the old file"""
+        self.journal.close()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps({'op': 'add', **entry}, ensure_ascii=False) + '\n')
+            for entry_id, score in self.scores.items():
+                f.write(json.dumps({'op': 'score', 'id': entry_id, **score}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.journal_ops = len(self.entries) + len(self.scores)
+        self.journal = open(self.path, 'a', encoding='utf-8')
+
+    def all_entries(self):
+        return [dict(entry) for entry in self.entries.values()]
+
+    def add(self, entry):
+        entry_id = self.next_id
+        entry = normalize_fields(entry)
+        self._append([{'op': 'add', 'id': entry_id, **{k: entry[k] for k in DIARY_FIELDS}}])
+        return entry_id
+
+    def add_many(self, entries):
+        first_id = self.next_id
+        records = [{'op': 'add', 'id': first_id + i, **{k: entry[k] for k in DIARY_FIELDS}}
+                   for i, entry in enumerate(map(normalize_fields, entries))]
+        self._append(records)
+        return [record['id'] for record in records]
+
+    def update(self, entry_id, fields):
+        fields = normalize_fields({k: v for k, v in fields.items() if k in DIARY_FIELDS})
+        if not fields:
+            return
+        self._append([{'op': 'update', 'id': entry_id, 'fields': fields}])
+
+    def get(self, entry_id):
+        entry = self.entries.get(entry_id)
+        return dict(entry) if entry else None
+
+    def search(self, emotion=None, date_from=None, date_to=None, keyword=None, before_id=None, limit=200):
+        candidates = None
+        if emotion:
+            candidates = set(self.emotion_index.get(emotion, ()))
+        if keyword:
+            for token in tokenize_keywords(keyword):
+                ids = self.token_index.get(token, set())
+                candidates = set(ids) if candidates is None else candidates & ids
+        if date_from or date_to:
+            lower, upper = date_bounds(date_from, date_to)
+            start = bisect.bisect_left(self.date_index, (lower, -1)) if lower else 0
+            end = bisect.bisect_right(self.date_index, (upper, float('inf'))) if upper else len(self.date_index)
+            ids = {entry_id for _, entry_id in self.date_index[start:end]}
+            candidates = ids if candidates is None else candidates & ids
+        if candidates is None:
+            return self.page_before(before_id, limit)
+
+        if before_id is not None:
+            candidates = {entry_id for entry_id in candidates if entry_id < before_id}
+        return [dict(self.entries[entry_id]) for entry_id in heapq.nlargest(limit, candidates)]
+
+    def delete(self, entry_id):
+        self._append([{'op': 'delete', 'id': entry_id}])
+
+    def count(self):
+        return len(self.entries)
+
+    def emotion_rollups(self, granularity='day'):
+        return dict(self.rollups[granularity])
+
+    def get_score(self, entry_id):
+        score = self.scores.get(entry_id)
+        return dict(score) if score else None
+
+    def _is_unscored(self, entry_id, model_version):
+        score = self.scores.get(entry_id)
+        return score is None or score['model_version'] != model_version
+
+    def iter_unscored(self, model_version, page_size=1000):
+        pending = [entry_id for entry_id in sorted(self.entries) if self._is_unscored(entry_id, model_version)]
+        for start in range(0, len(pending), page_size):
+            page = [dict(self.entries[entry_id]) for entry_id in pending[start:start + page_size]
+                    if entry_id in self.entries]
+            if page:
+                yield page
+
+    def count_unscored(self, model_version):
+        return sum(1 for entry_id in self.entries if self._is_unscored(entry_id, model_version))
+
+    def save_scores(self, scores, relabel=False):
+        records = []
+        for score in scores:
+            entry = self.entries.get(score['id'])
+            if entry is None or entry['text'] != score['text']:
+                continue
+            records.append({'op': 'score', 'id': score['id'], 'model_version': score['model_version'],
+                            'emotion': score['emotion'], 'probabilities': score['probabilities']})
+            if relabel and entry['emotion'] != score['emotion']:
+                records.append({'op': 'update', 'id': score['id'], 'fields': {'emotion': score['emotion']}})
+        if records:
+            self._append(records)
+
+    def close(self):
+        self.journal.close()
+
+
+class SqliteDiaryStore(DiaryStore):
+    """SQLite store in WAL mode with indexes on date and emotion; every change touches one row"""
+    def __init__(self, path):
+        self.path = path
+        # The app opens the store on its loader thread and then uses it from the GUI thread only
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        fts_exists = self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'entries_fts'").fetchone()
+        if fts_exists and FTS_TOKENIZE not in fts_exists[0]:
+            # Indexes built with the default tokenizer are rebuilt with the one the other backends agree with
+            self.conn.execute("DROP TABLE entries_fts")
+            fts_exists = None
+        rollups_exist = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'emotion_rollups'").fetchone()
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                text TEXT NOT NULL,
+                emotion TEXT NOT NULL,
+                date TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_date ON entries(date);
+            CREATE INDEX IF NOT EXISTS idx_entries_emotion ON entries(emotion);
+
+            -- Full-text index kept in step with entries by triggers, so every add/edit/delete updates it
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                text, content='entries', content_rowid='id', tokenize="{FTS_TOKENIZE}"
+            );
+            CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts(rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_fts_update AFTER UPDATE OF text ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                INSERT INTO entries_fts(rowid, text) VALUES (new.id, new.text);
+            END;
+        """)
+        if not fts_exists:
+            # Diaries created before the full-text index existed are indexed once
+            self.conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+        self._create_rollups(populate=not rollups_exist)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entry_scores (
+                entry_id INTEGER PRIMARY KEY,
+                model_version TEXT NOT NULL,
+                emotion TEXT NOT NULL,
+                probabilities TEXT NOT NULL
+            );
+            CREATE TRIGGER IF NOT EXISTS entry_scores_delete AFTER DELETE ON entries BEGIN
+                DELETE FROM entry_scores WHERE entry_id = old.id;
+            END;
+            CREATE TRIGGER IF NOT EXISTS entry_scores_text_update AFTER UPDATE OF text ON entries
+            WHEN new.text IS NOT old.text BEGIN
+                DELETE FROM entry_scores WHERE entry_id = old.id;
+            END;
+        """)
+        self.conn.commit()
+
+    # SQL equivalents of rollup_bucket for each granularity
+    _BUCKET_SQL = {
+        'day': "substr({row}.date, 1, 10)",
+        'week': "COALESCE(strftime('%Y-W%W', substr({row}.date, 1, 10)), 'unknown')",
+        'month': "substr({row}.date, 1, 7)"
+    }
+
+    def _create_rollups(self, populate):
+        """Counter table kept current by triggers: each add/edit/delete adjusts a few counters"""
+        increment = "".join(
+            f"INSERT INTO emotion_rollups (granularity, bucket, emotion, count) "
+            f"VALUES ('{g}', {sql.format(row='new')}, new.emotion, 1) "
+            f"ON CONFLICT(granularity, bucket, emotion) DO UPDATE SET count = count + 1;\n"
+            for g, sql in self._BUCKET_SQL.items())
+        decrement = "".join(
+            f"UPDATE emotion_rollups SET count = count - 1 "
+            f"WHERE granularity = '{g}' AND bucket = {sql.format(row='old')} AND emotion = old.emotion;\n"
+            f"DELETE FROM emotion_rollups "
+            f"WHERE granularity = '{g}' AND bucket = {sql.format(row='old')} AND emotion = old.emotion AND count <= 0;\n"
+            for g, sql in self._BUCKET_SQL.items())
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS emotion_rollups (
+                granularity TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                emotion TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (granularity, bucket, emotion)
+            );
+            CREATE TRIGGER IF NOT EXISTS emotion_rollups_insert AFTER INSERT ON entries BEGIN
+                {increment}
+            END;
+            CREATE TRIGGER IF NOT EXISTS emotion_rollups_delete AFTER DELETE ON entries BEGIN
+                {decrement}
+            END;
+            CREATE TRIGGER IF NOT EXISTS emotion_rollups_update AFTER UPDATE OF emotion, date ON entries BEGIN
+                {decrement}
+                {increment}
+            END;
+        """)
+        if populate:
+            # Diaries created before the rollup table existed are aggregated once
+            for g, sql in self._BUCKET_SQL.items():
+                self.conn.execute(
+                    f"INSERT INTO emotion_rollups (granularity, bucket, emotion, count) "
+                    f"SELECT '{g}', {sql.format(row='entries')}, emotion, COUNT(*) FROM entries "
+                    f"GROUP BY {sql.format(row='entries')}, emotion")
+
+    @staticmethod
+    def _row_to_entry(row):
+        return {'id': row[0], 'text': row[1], 'emotion': row[2], 'date': row[3]}
+
+    def all_entries(self):
+        rows = self.conn.execute("SELECT id, text, emotion, date FROM entries ORDER BY id")
+        return [self._row_to_entry(r) for r in rows]
+
+    def get(self, entry_id):
+        row = self.conn.execute("SELECT id, text, emotion, date FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def page_before(self, before_id=None, limit=200):
+        # Walks the primary key index backwards, so deep pages cost the same as the first
+        if before_id is None:
+            rows = self.conn.execute(
+                "SELECT id, text, emotion, date FROM entries ORDER BY id DESC LIMIT ?", (limit,))
+        else:
+            rows = self.conn.execute(
+                "SELECT id, text, emotion, date FROM entries WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before_id, limit))
+        return [self._row_to_entry(r) for r in rows]
+
+    def add(self, entry):
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO entries (text, emotion, date) VALUES (?, ?, ?)",
+                (entry['text'], entry['emotion'], normalize_date(entry['date']))
+            )
+        return cursor.lastrowid
+
+    def add_many(self, entries):
+        if not entries:
+            return []
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO entries (text, emotion, date) VALUES (?, ?, ?)",
+                ((entry['text'], entry['emotion'], normalize_date(entry['date'])) for entry in entries)
+            )
+            end_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+        return list(range(end_id - len(entries) + 1, end_id + 1))
+
+    def search(self, emotion=None, date_from=None, date_to=None, keyword=None, before_id=None, limit=200):
+        clauses, params = [], []
+        if emotion:
+            clauses.append("emotion = ?")
+            params.append(emotion)
+        lower, upper = date_bounds(date_from, date_to)
+        if lower:
+            clauses.append("date >= ?")
+            params.append(lower)
+        if upper:
+            clauses.append("date <= ?")
+            params.append(upper)
+        tokens = tokenize_keywords(keyword or '')
+        if tokens:
+            clauses.append("id IN (SELECT rowid FROM entries_fts WHERE entries_fts MATCH ?)")
+            params.append(' '.join(f'"{token}"' for token in tokens))
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.conn.execute(
+            f"SELECT id, text, emotion, date FROM entries {where} ORDER BY id DESC LIMIT ?", (*params, limit))
+        return [self._row_to_entry(r) for r in rows]
+
+    def update(self, entry_id, fields):
+        fields = normalize_fields({k: v for k, v in fields.items() if k in DIARY_FIELDS})
+        if not fields:
+            return
+        assignments = ', '.join(f"{k} = ?" for k in fields)
+        with self.conn:
+            self.conn.execute(f"UPDATE entries SET {assignments} WHERE id = ?", (*fields.values(), entry_id))
+
+    def delete(self, entry_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def emotion_rollups(self, granularity='day'):
+        rows = self.conn.execute(
+            "SELECT bucket, emotion, count FROM emotion_rollups WHERE granularity = ?", (granularity,))
+        return {(bucket, emotion): count for bucket, emotion, count in rows}
+
+    def get_score(self, entry_id):
+        row = self.conn.execute(
+            "SELECT model_version, emotion, probabilities FROM entry_scores WHERE entry_id = ?", (entry_id,)).fetchone()
+        if row is None:
+            return None
+        return {'model_version': row[0], 'emotion': row[1], 'probabilities': json.loads(row[2])}
+
+    _UNSCORED_WHERE = "(s.model_version IS NULL OR s.model_version != ?)"
+
+    def iter_unscored(self, model_version, page_size=1000):
+        # Keyset pagination over the primary key; scores written between pages do not shift the window
+        after_id = 0
+        while True:
+            rows = self.conn.execute(
+                f"SELECT e.id, e.text, e.emotion, e.date FROM entries e "
+                f"LEFT JOIN entry_scores s ON s.entry_id = e.id "
+                f"WHERE e.id > ? AND {self._UNSCORED_WHERE} ORDER BY e.id LIMIT ?",
+                (after_id, model_version, page_size)).fetchall()
+            if not rows:
+                return
+            yield [self._row_to_entry(r) for r in rows]
+            after_id = rows[-1][0]
+
+    def count_unscored(self, model_version):
+        return self.conn.execute(
+            f"SELECT COUNT(*) FROM entries e LEFT JOIN entry_scores s ON s.entry_id = e.id "
+            f"WHERE {self._UNSCORED_WHERE}", (model_version,)).fetchone()[0]
+
+    def save_scores(self, scores, relabel=False):
+        # The text comparison drops scores for entries edited (or deleted) while their batch was being scored
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO entry_scores (entry_id, model_version, emotion, probabilities) "
+                "SELECT id, ?, ?, ? FROM entries WHERE id = ? AND text = ?",
+                ((score['model_version'], score['emotion'], json.dumps(score['probabilities']),
+                  score['id'], score['text']) for score in scores))
+            if relabel:
+                self.conn.executemany(
+                    "UPDATE entries SET emotion = ? WHERE id = ? AND text = ? AND emotion != ?",
+                    ((score['emotion'], score['id'], score['text'], score['emotion']) for score in scores))
+
+    def close(self):
+        self.conn.close()
+
+
+def read_legacy_csv(path):
+    """Read entries from the old pandas-written emotion_diary.csv"""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    fallback_date = time.strftime(DATE_FORMAT)
+    entries, invalid_dates = [], 0
+    for row in rows:
+        try:
+            date = normalize_date(row['date']) if row.get('date') else fallback_date
+        except ValueError:
+            date = fallback_date
+            invalid_dates += 1
+        entries.append({'text': row.get('text') or '', 'emotion': row.get('emotion') or '', 'date': date})
+    if invalid_dates:
+        print(f"Warning: {invalid_dates} entries in {path} had invalid dates and were given {fallback_date}")
+    return entries
+
+
+def open_diary_store(path):
+    """Open the backend matching the file extension (.db/.sqlite, .jsonl or legacy .csv)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.db', '.sqlite', '.sqlite3'):
+        return SqliteDiaryStore(path)
+    if extension == '.jsonl':
+        return JournalDiaryStore(path)
+    if extension == '.csv':
+        return CsvDiaryStore(path)
+    raise ValueError(f"Unsupported diary file type: {path}")
+
+
+def migrate_csv_diary(csv_path, store):
+    """One-time import of a legacy CSV diary into an empty store; the CSV is kept as *.migrated"""
+    if not os.path.exists(csv_path) or store.count() > 0:
+        return 0
+    entries = read_legacy_csv(csv_path)
+    store.add_many(entries)
+    os.replace(csv_path, csv_path + '.migrated')
+    print(f"Migrated {len(entries)} diary entries from {csv_path}")
+    return len(entries)
+
+
+def rescore_diary(store, score_texts, model_version, batch_size=512, relabel=False, progress=None,
+                  is_cancelled=None):
+    """Score every entry not yet scored by model_version in batches.
+
+    score_texts maps a list of raw texts to a list of {emotion: probability} dicts in one vectorized call.
+    progress(done, total) is called after each batch; is_cancelled() is checked between batches, and
+    batches already saved are kept, so a cancelled run resumes where it stopped.
+    """
+    start = time.perf_counter()
+    total = store.count_unscored(model_version)
+    summary = {'model_version': model_version, 'pending': total, 'scored': 0,
+               'skipped': store.count() - total, 'cancelled': False}
+    if progress:
+        progress(0, total)
+    for page in store.iter_unscored(model_version, page_size=batch_size):
+        if is_cancelled and is_cancelled():
+            summary['cancelled'] = True
+            break
+        probabilities = score_texts([entry['text'] for entry in page])
+        store.save_scores([
+            {'id': entry['id'], 'text': entry['text'], 'model_version': model_version,
+             'emotion': max(probs, key=probs.get), 'probabilities': probs}
+            for entry, probs in zip(page, probabilities)
+        ], relabel=relabel)
+        summary['scored'] += len(page)
+        if progress:
+            progress(summary['scored'], total)
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+# Benchmark: python diary_storage.py --sizes 10000 100000 1000000
+def _synthetic_entries(n):
+    emotions = ['anger', 'fear', 'joy', 'love', 'sadness', 'surprise']
+    return [{'text': f"synthetic diary entry number {i} about my day", 'emotion': emotions[i % len(emotions)],
+             'date': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1700000000 + i * 60))}
+            for i in range(n)]
+
+def benchmark_store(backend, size, workdir, ops=100):
+    """Time bulk load, reopen, and the mean add/update/delete latency for one backend at one size"""
+    extension = {'csv': '.csv', 'journal': '.jsonl', 'sqlite': '.db'}[backend]
+    path = os.path.join(workdir, f'diary_{backend}_{size}{extension}')
+    entries = _synthetic_entries(size)
+    if backend == 'csv':
+        ops = min(ops, 3)  # Every CSV operation rewrites the whole file
+
+    result = {'backend': backend, 'entries': size}
+    start_time = time.perf_counter()
+    store = open_diary_store(path)
+    store.add_many(entries)
+    result['bulk_load_s'] = time.perf_counter() - start_time
+    store.close()
+
+    start_time = time.perf_counter()
+    store = open_diary_store(path)
+    result['open_s'] = time.perf_counter() - start_time
+
+    new_entry = {'text': 'benchmark entry', 'emotion': 'joy', 'date': '2024-01-01 00:00:00'}
+    start_time = time.perf_counter()
+    ids = [store.add(new_entry) for _ in range(ops)]
+    result['add_ms'] = (time.perf_counter() - start_time) / ops * 1000
+
+    start_time = time.perf_counter()
+    for entry_id in ids:
+        store.update(entry_id, {'text': 'edited benchmark entry', 'emotion': 'love'})
+    result['update_ms'] = (time.perf_counter() - start_time) / ops * 1000
+
+    start_time = time.perf_counter()
+    for entry_id in ids:
+        store.delete(entry_id)
+    result['delete_ms'] = (time.perf_counter() - start_time) / ops * 1000
+    store.close()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark diary storage backends")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--backends', nargs='+', default=['csv', 'journal', 'sqlite'])
+    parser.add_argument('--ops', type=int, default=100)
+    parser.add_argument('--check-rollups', metavar='DIARY_FILE',
+                        help="verify a diary's incremental rollups against a full recomputation and exit")
+    args = parser.parse_args()
+
+    if args.check_rollups:
+        store = open_diary_store(args.check_rollups)
+        mismatches = verify_rollups(store)
+        store.close()
+        print("Rollups consistent" if not mismatches else f"Rollup mismatches: {mismatches}")
+        raise SystemExit(1 if mismatches else 0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            for backend in args.backends:
+                result = benchmark_store(backend, size, workdir, args.ops)
+                print(", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items()))
@@ -0,0 +1,290 @@
+"""Compact model format and dependency-light NumPy inference engine for the emotion classifier"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import hashlib
+import subprocess
+import numpy as np
+from scipy import sparse
+from emotion_predictor import EmotionPredictor
+
+COMPACT_FORMAT_VERSION = 1
+
+
+def _compact_arrays(pipeline, emotion_mapping):
+    """Extract metadata and float32 arrays from a fitted TfidfVectorizer/LogisticRegression pipeline"""
+    vectorizer = pipeline.steps[0][1]
+    classifier = pipeline.steps[-1][1]
+    if vectorizer.analyzer != 'word' or vectorizer.tokenizer or vectorizer.preprocessor \
+            or vectorizer.stop_words or vectorizer.strip_accents:
+        raise ValueError("Only the default word analyzer without custom tokenizer, "
+                         "preprocessor, stop words or accent stripping can be exported")
+
+    # Sorted UTF-8 string table: terms[i] is found by binary search, term_columns[i] is its feature column.
+    # Byte order of UTF-8 matches code point order, so sorting the encoded terms keeps the search valid.
+    vocabulary = vectorizer.vocabulary_
+    encoded_terms = sorted((term.encode('utf-8'), column) for term, column in vocabulary.items())
+    terms = np.array([term for term, _ in encoded_terms], dtype=np.bytes_)
+    term_columns = np.array([column for _, column in encoded_terms], dtype=np.int32)
+
+    if getattr(vectorizer, 'use_idf', True):
+        idf = vectorizer.idf_.astype(np.float32)
+    else:
+        idf = np.ones(len(vocabulary), dtype=np.float32)
+
+    # 'auto' is one-vs-rest for liblinear and for two classes, as in sklearn; newer sklearn versions without
+    # multi_class always score two classes with a sigmoid
+    multi_class = getattr(classifier, 'multi_class', 'auto')
+    if multi_class in ('auto', 'deprecated'):
+        binary = len(classifier.classes_) <= 2
+        multi_class = 'ovr' if binary or getattr(classifier, 'solver', 'lbfgs') == 'liblinear' else 'multinomial'
+
+    metadata = {
+        'format_version': COMPACT_FORMAT_VERSION,
+        'emotion_mapping': {str(k): int(v) for k, v in emotion_mapping.items()},
+        'classes': [int(c) for c in classifier.classes_],
+        'lowercase': bool(vectorizer.lowercase),
+        'token_pattern': vectorizer.token_pattern,
+        'ngram_range': list(vectorizer.ngram_range),
+        'sublinear_tf': bool(vectorizer.sublinear_tf),
+        'norm': vectorizer.norm,
+        'multi_class': multi_class
+    }
+    arrays = {
+        'terms': terms,
+        'term_columns': term_columns,
+        'idf': idf,
+        'coef': classifier.coef_.astype(np.float32),
+        'intercept': classifier.intercept_.astype(np.float32)
+    }
+    return metadata, arrays
+
+
+def compact_model_version(arrays):
+    """Content hash of the exported weights, used as the model version when none is given"""
+    digest = hashlib.sha1()
+    for name in ('terms', 'idf', 'coef', 'intercept'):
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()[:12]
+
+
+def export_compact_model(pipeline, emotion_mapping, export_dir, model_version=None):
+    """Export a fitted TfidfVectorizer/LogisticRegression pipeline as float32 .npy arrays"""
+    metadata, arrays = _compact_arrays(pipeline, emotion_mapping)
+    metadata['model_version'] = model_version or compact_model_version(arrays)
+    os.makedirs(export_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(export_dir, f'{name}.npy'), array)
+    with open(os.path.join(export_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    return export_dir
+
+
+class CompactEmotionModel:
+    """TF-IDF + linear classifier scored from memory-mapped arrays, with a predict/predict_proba API"""
+    def __init__(self, metadata, terms, term_columns, idf, coef, intercept):
+        self.metadata = metadata
+        self.emotion_mapping = metadata['emotion_mapping']
+        self.classes_ = np.array(metadata['classes'])
+        self.terms = terms
+        self.term_columns = term_columns
+        self.idf = idf
+        self.coef = coef
+        self.intercept = intercept
+        self.lowercase = metadata['lowercase']
+        self.token_pattern = re.compile(metadata['token_pattern'])
+        self.min_n, self.max_n = metadata['ngram_range']
+        self.sublinear_tf = metadata['sublinear_tf']
+        self.norm = metadata['norm']
+        self.multi_class = metadata['multi_class']
+        self._model_version = metadata.get('model_version')
+
+    @property
+    def model_version(self):
+        """Version recorded at export, or a content hash for exports that predate it"""
+        if self._model_version is None:
+            self._model_version = compact_model_version(
+                {'terms': self.terms, 'idf': self.idf, 'coef': self.coef, 'intercept': self.intercept})
+        return self._model_version
+
+    def _ngrams(self, text):
+        """Extract word n-grams the same way TfidfVectorizer's word analyzer does"""
+        if self.lowercase:
+            text = text.lower()
+        tokens = self.token_pattern.findall(text)
+        grams = list(tokens) if self.min_n == 1 else []
+        for n in range(max(self.min_n, 2), min(self.max_n, len(tokens)) + 1):
+            grams.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    def transform(self, texts):
+        """Build the l2-normalized TF-IDF matrix for texts as a CSR matrix"""
+        texts = list(texts)
+        n_docs = len(texts)
+        doc_ids = []
+        grams = []
+        for doc_id, text in enumerate(texts):
+            text_grams = self._ngrams(text)
+            grams.extend(text_grams)
+            doc_ids.extend([doc_id] * len(text_grams))
+
+        if not grams:
+            return sparse.csr_matrix((n_docs, len(self.idf)), dtype=np.float64)
+
+        # One binary search over the sorted string table for every n-gram in the batch
+        grams = np.array([gram.encode('utf-8') for gram in grams], dtype=np.bytes_)
+        positions = np.searchsorted(self.terms, grams)
+        positions[positions == len(self.terms)] = 0
+        found = self.terms[positions] == grams
+        rows = np.asarray(doc_ids)[found]
+        columns = self.term_columns[positions[found]]
+
+        X = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, columns)), shape=(n_docs, len(self.idf)), dtype=np.float64
+        )
+        X.sum_duplicates()
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        X.data *= self.idf[X.indices]
+        if self.norm == 'l2':
+            row_norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+            row_norms[row_norms == 0] = 1
+            X.data /= np.repeat(row_norms, np.diff(X.indptr))
+        elif self.norm == 'l1':
+            row_norms = np.asarray(abs(X).sum(axis=1)).ravel()
+            row_norms[row_norms == 0] = 1
+            X.data /= np.repeat(row_norms, np.diff(X.indptr))
+        return X
+
+    def decision_function(self, texts):
+        X = self.transform(texts)
+        return np.asarray(X @ self.coef.T, dtype=np.float64) + self.intercept
+
+    def predict_proba(self, texts):
+        """Return class probabilities in the column order of classes_"""
+        scores = self.decision_function(texts)
+        if scores.shape[1] == 1:
+            # A two-class multinomial model is softmax([-d, d]), which is sigmoid(2d)
+            scale = 2.0 if self.multi_class == 'multinomial' else 1.0
+            positive = 1.0 / (1.0 + np.exp(-scale * scores[:, 0]))
+            return np.column_stack([1 - positive, positive])
+        if self.multi_class == 'ovr':
+            probs = 1.0 / (1.0 + np.exp(-scores))
+            return probs / probs.sum(axis=1, keepdims=True)
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, scores)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def predict(self, texts):
+        return self.classes_[self.predict_proba(texts).argmax(axis=1)]
+
+
+def load_compact_model(export_dir, mmap=True):
+    """Load a compact model; arrays are memory-mapped so processes on one host share the pages"""
+    with open(os.path.join(export_dir, 'metadata.json'), 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    if metadata.get('format_version') != COMPACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported compact model format version: {metadata.get('format_version')}")
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {
+        name: np.load(os.path.join(export_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+        for name in ('terms', 'term_columns', 'idf', 'coef', 'intercept')
+    }
+    return CompactEmotionModel(metadata, **arrays)
+
+
+def verify_compact_model(pipeline, export_dir, texts, atol=1e-5):
+    """Round-trip check: the compact model must reproduce the pipeline's predict_proba and labels"""
+    compact_model = load_compact_model(export_dir)
+    texts = list(texts)
+    expected = pipeline.predict_proba(texts)
+    actual = compact_model.predict_proba(texts)
+    max_diff = float(np.abs(expected - actual).max()) if len(texts) else 0.0
+    if max_diff > atol:
+        raise ValueError(f"Compact model probabilities differ from the pipeline by {max_diff:.2e}")
+    if not np.array_equal(pipeline.predict(texts), compact_model.predict(texts)):
+        raise ValueError("Compact model labels differ from the pipeline")
+    return max_diff
+
+
+class NumpyEmotionPredictor(EmotionPredictor):
+    """EmotionPredictor backed by a CompactEmotionModel instead of sklearn; preprocessing, caching and
+    scoring are EmotionPredictor's"""
+    def __init__(self, model, emotion_mapping=None, cache=None, lemma_table=None):
+        super().__init__(model, emotion_mapping or model.emotion_mapping, cache, lemma_table)
+
+    @classmethod
+    def from_pipeline(cls, pipeline, emotion_mapping, cache=None, lemma_table=None):
+        """Build the engine in memory from a trained sklearn pipeline"""
+        metadata, arrays = _compact_arrays(pipeline, emotion_mapping)
+        return cls(CompactEmotionModel(metadata, **arrays), emotion_mapping, cache, lemma_table)
+
+    @classmethod
+    def from_directory(cls, export_dir, mmap=True, cache=None, lemma_table=None):
+        """Build the engine from a compact model directory written by export_compact_model"""
+        return cls(load_compact_model(export_dir, mmap=mmap), cache=cache, lemma_table=lemma_table)
+
+
+# Parity check and benchmark: python emotion_inference_engine.py --pickle emotion_model.pkl --texts prediction_results.csv
+_COLD_START_SNIPPETS = {
+    'numpy_engine': "from emotion_inference_engine import load_compact_model; "
+                    "m = load_compact_model({compact_dir!r}); m.predict_proba(['feel great'])",
+    'sklearn_pickle': "import pickle; m = pickle.load(open({pickle_path!r}, 'rb')); m.predict_proba(['feel great'])"
+}
+
+def _cold_start_seconds(snippet, repeats):
+    timings = []
+    for _ in range(repeats):
+        start_time = time.time()
+        subprocess.run([sys.executable, '-c', snippet], check=True, capture_output=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        timings.append(time.time() - start_time)
+    return min(timings)
+
+def _per_row_latency_ms(score_one, texts):
+    start_time = time.perf_counter()
+    for text in texts:
+        score_one([text])
+    return (time.perf_counter() - start_time) / len(texts) * 1000
+
+def run_benchmark(compact_dir, pickle_path, texts_path, n_rows=1000, repeats=3):
+    """Check parity with the sklearn pipeline and compare cold-start time and per-row latency"""
+    with open(texts_path, 'r', encoding='utf-8') as f:
+        if texts_path.endswith('.csv'):
+            import csv
+            texts = [row[0] for row in csv.reader(f)][1:n_rows + 1]
+        else:
+            texts = [line.strip() for line in f if line.strip()][:n_rows]
+
+    engine = load_compact_model(compact_dir)
+    report = {'rows': len(texts)}
+    for name, template in _COLD_START_SNIPPETS.items():
+        report[f'{name}_cold_start_s'] = _cold_start_seconds(
+            template.format(compact_dir=os.path.abspath(compact_dir), pickle_path=os.path.abspath(pickle_path)),
+            repeats
+        )
+    report['numpy_engine_row_latency_ms'] = _per_row_latency_ms(engine.predict_proba, texts)
+
+    import pickle
+    with open(pickle_path, 'rb') as f:
+        pipeline = pickle.load(f)
+    report['sklearn_pickle_row_latency_ms'] = _per_row_latency_ms(pipeline.predict_proba, texts)
+    report['max_probability_difference'] = verify_compact_model(pipeline, compact_dir, texts)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="NumPy inference engine parity check and benchmark")
+    parser.add_argument('--compact-dir', default='emotion_model_compact')
+    parser.add_argument('--pickle', default='emotion_model.pkl')
+    parser.add_argument('--texts', default='prediction_results.csv')
+    parser.add_argument('--rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    for key, value in run_benchmark(args.compact_dir, args.pickle, args.texts, args.rows).items():
+        print(f"{key}: {value:.4g}" if isinstance(value, float) else f"{key}: {value}")
@@ -0,0 +1,226 @@
+"""Local asyncio inference server that micro-batches concurrent requests into one predict_proba call"""
+import os
+import json
+import time
+import pickle
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from emotion_predictor import EmotionPredictor
+from emotion_inference_engine import NumpyEmotionPredictor
+from text_preprocessing import LemmaTable
+
+MAX_BODY_BYTES = 1 << 20
+
+
+def load_predictor(pickle_path='emotion_model.pkl', mapping_path='emotion_mapping.pkl', lemma_table_path=None,
+                   compact_dir=None):
+    """EmotionPredictor for the pickled sklearn pipeline, or for the compact NumPy model when compact_dir is given"""
+    lemma_table = None
+    if lemma_table_path and os.path.exists(lemma_table_path):
+        lemma_table = LemmaTable.load(lemma_table_path)
+        print(f"Loaded lemma table with {len(lemma_table.table)} tokens")
+    if compact_dir:
+        return NumpyEmotionPredictor.from_directory(compact_dir, lemma_table=lemma_table)
+    with open(pickle_path, 'rb') as f:
+        pipeline = pickle.load(f)
+    with open(mapping_path, 'rb') as f:
+        emotion_mapping = pickle.load(f)
+    return EmotionPredictor(pipeline, emotion_mapping, lemma_table=lemma_table)
+
+
+def _to_json_result(result):
+    return {
+        'emotion': str(result['emotion']),
+        'confidence': float(result['confidence']),
+        'margin': float(result['margin']),
+        'probabilities': {emotion: float(p) for emotion, p in result['probabilities'].items()}
+    }
+
+
+class MicroBatcher:
+    """Collects concurrent requests until max_batch_size texts or max_wait_ms have accumulated, then scores them at once"""
+    def __init__(self, predictor, max_batch_size=64, max_wait_ms=5.0):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        # Scoring runs on one worker thread so the event loop keeps accepting requests meanwhile
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batch_sizes = []
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    async def predict(self, texts):
+        """Queue texts for the next batch and wait for their results"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    def _score(self, texts):
+        return [_to_json_result(result) for result in self.predictor.predict_batch(texts, keep_empty=True)]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self.queue.get()]
+            n_texts = len(requests[0][0])
+            deadline = loop.time() + self.max_wait
+            while n_texts < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                n_texts += len(request[0])
+
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            self.batch_sizes.append(len(texts))
+            try:
+                results = await loop.run_in_executor(self.executor, self._score, texts) if texts else []
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            offset = 0
+            for request_texts, future in requests:
+                if not future.done():
+                    future.set_result(results[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    def stats(self):
+        sizes = np.array(self.batch_sizes or [0])
+        return {
+            'batches': len(self.batch_sizes),
+            'texts': int(sizes.sum()),
+            'mean_batch_size': float(sizes.mean()),
+            'max_batch_size': int(sizes.max()),
+            'config': {'max_batch_size': self.max_batch_size, 'max_wait_ms': self.max_wait * 1000}
+        }
+
+
+class InferenceServer:
+    """Minimal HTTP/1.1 server with keep-alive: POST /predict {"text": ...} or {"texts": [...]}, GET /health"""
+    def __init__(self, predictor, max_batch_size=64, max_wait_ms=5.0):
+        self.batcher = MicroBatcher(predictor, max_batch_size, max_wait_ms)
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8765, unix_path=None):
+        self.batcher.start()
+        if unix_path:
+            if os.path.exists(unix_path):
+                os.remove(unix_path)
+            self.server = await asyncio.start_unix_server(self._handle_connection, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': 'request body too large'})
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self._dispatch(method, path, body)
+                await self._respond(writer, status, payload)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok', **self.batcher.stats()}
+        if method != 'POST' or path != '/predict':
+            return 404, {'error': f'unknown endpoint {method} {path}'}
+        try:
+            request = json.loads(body or b'{}')
+            single = 'text' in request
+            texts = [request['text']] if single else request['texts']
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("'text' must be a string or 'texts' a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {'error': f'invalid request: {e}'}
+        try:
+            results = await self.batcher.predict(texts)
+        except Exception as e:
+            return 500, {'error': str(e)}
+        return 200, results[0] if single else {'results': results}
+
+    @staticmethod
+    async def _respond(writer, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large'}.get(status, 'Error')
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(predictor, host, port, unix_path, max_batch_size, max_wait_ms):
+    server = InferenceServer(predictor, max_batch_size, max_wait_ms)
+    await server.start(host, port, unix_path)
+    print(f"Serving on {unix_path or f'http://{host}:{port}'} "
+          f"(max batch size {max_batch_size}, max wait {max_wait_ms} ms)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-batching emotion inference server")
+    parser.add_argument('--pickle', default='emotion_model.pkl')
+    parser.add_argument('--mapping', default='emotion_mapping.pkl')
+    parser.add_argument('--compact-dir', help="serve the compact NumPy model in this directory instead of the pickle")
+    parser.add_argument('--lemma-table', default='lemma_table.pkl', help="used when present; WordNet otherwise")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="listen on a Unix socket instead of TCP")
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    predictor = load_predictor(args.pickle, args.mapping, args.lemma_table, args.compact_dir)
+    print(f"Model loaded in {time.time() - start_time:.2f} seconds")
+    try:
+        asyncio.run(serve(predictor, args.host, args.port, args.unix, args.max_batch_size, args.max_wait_ms))
+    except KeyboardInterrupt:
+        print("Server stopped")
@@ -0,0 +1,205 @@
+"""EmotionPredictor for trained scikit-learn pipelines, and model saving for the training scripts"""
+import os
+import time
+import pickle
+import numpy as np
+import pandas as pd
+from pipeline_metrics import pipeline_metrics
+from text_preprocessing import preprocess_text, preprocessing_cache
+
+
+def save_model(model, emotion_mapping, model_path, mapping_path, report, report_path, lemma_table=None):
+    """Save the trained model, emotion mapping, classification report and lemma table with versioning"""
+    try:
+        os.makedirs(os.path.dirname(model_path), exist_ok=True)
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        model_path = model_path.replace('.pkl', f'_{timestamp}.pkl')
+        mapping_path = mapping_path.replace('.pkl', f'_{timestamp}.pkl')
+        report_path = report_path.replace('.txt', f'_{timestamp}.txt')
+
+        with open(model_path, 'wb') as f:
+            pickle.dump(model, f)
+        with open(mapping_path, 'wb') as f:
+            pickle.dump(emotion_mapping, f)
+        with open(report_path, 'w') as f:
+            f.write(report)
+        if lemma_table is not None:
+            # Saved under the name the diary app and inference tools load. Lemmas depend only on NLTK, not on
+            # the model, so a newer table only covers more tokens and serves earlier model versions as well.
+            lemma_table_path = os.path.join(os.path.dirname(model_path), 'lemma_table.pkl')
+            lemma_table.save(lemma_table_path)
+            print(f"Lemma table ({len(lemma_table.table)} tokens) saved to {lemma_table_path}")
+
+        print(f"Model saved to {model_path}")
+        print(f"Emotion mapping saved to {mapping_path}")
+        print(f"Classification report saved to {report_path}")
+        return model_path, mapping_path, report_path
+
+    except Exception as e:
+        print(f"Error saving model: {str(e)}")
+        raise
+
+
+class EmotionPredictor:
+    """A class for making emotion predictions with confidence scores"""
+    def __init__(self, model, emotion_mapping, cache=None, lemma_table=None):
+        self.model = model
+        self.emotion_mapping = emotion_mapping
+        # Shares the module-level preprocessing cache with preprocess_data by default; pass the lemma
+        # table the model was trained with, or None for the per-token WordNet path
+        self.cache = preprocessing_cache if cache is None else cache
+        self.lemma_table = lemma_table
+        self.id_to_emotion = {v: k for k, v in emotion_mapping.items()}
+
+    def predict(self, text):
+        """Predict emotion from text"""
+        return self._score_processed([preprocess_text(text, self.cache, self.lemma_table)])[0]
+
+    def _score_processed(self, processed_texts, columnar=False):
+        """Score preprocessed texts with a single TF-IDF transform and predict_proba call"""
+        # One transform + one predict_proba over the whole batch; labels, confidence
+        # and margin all come from the same probability matrix
+        if pipeline_metrics.enabled:
+            probs = self._predict_proba_timed(processed_texts)
+        else:
+            probs = self.model.predict_proba(processed_texts)
+        class_emotions = [self.id_to_emotion[c] for c in self.model.classes_]
+        top_idx = probs.argmax(axis=1)
+        confidence = probs[np.arange(len(probs)), top_idx]
+        if probs.shape[1] > 1:
+            runner_up = np.partition(probs, -2, axis=1)[:, -2]
+            margin = confidence - runner_up
+        else:
+            margin = confidence.copy()
+        emotions = np.asarray(class_emotions, dtype=object)[top_idx]
+
+        if columnar:
+            return {
+                'emotion': emotions,
+                'confidence': confidence,
+                'margin': margin,
+                'probabilities': probs,
+                'emotion_labels': class_emotions,
+                'processed_text': list(processed_texts)
+            }
+
+        results = []
+        for row, processed_text in enumerate(processed_texts):
+            results.append({
+                'emotion': emotions[row],
+                'confidence': confidence[row],
+                'margin': margin[row],
+                'probabilities': dict(zip(class_emotions, probs[row])),
+                'processed_text': processed_text
+            })
+        return results
+
+    def _predict_proba_timed(self, processed_texts):
+        """predict_proba with the TF-IDF transform and classifier timed as separate stages"""
+        pipeline_metrics.observe_batch('EmotionPredictor', len(processed_texts))
+        start = time.perf_counter()
+        if hasattr(self.model, 'steps'):
+            X = processed_texts
+            for _, step in self.model.steps[:-1]:
+                X = step.transform(X)
+            after_transform = time.perf_counter()
+            probs = self.model.steps[-1][1].predict_proba(X)
+            pipeline_metrics.observe('predict.tfidf_transform', after_transform - start)
+            pipeline_metrics.observe('predict.predict_proba', time.perf_counter() - after_transform)
+        else:
+            probs = self.model.predict_proba(processed_texts)
+            pipeline_metrics.observe('predict.predict_proba', time.perf_counter() - start)
+        return probs
+
+    def predict_batch(self, texts, columnar=False, keep_empty=False):
+        """Process a batch of texts and predict emotions with one vectorized model call.
+        Empty texts are skipped unless keep_empty, which returns exactly one result per input text."""
+        texts = list(texts) if keep_empty else [text for text in texts if text]
+        if not texts:
+            return {} if columnar else []
+
+        processed_texts = [preprocess_text(text, self.cache, self.lemma_table) for text in texts]
+        results = self._score_processed(processed_texts, columnar=columnar)
+        if columnar:
+            results['text'] = texts
+            return results
+        for text, result in zip(texts, results):
+            result['text'] = text
+        return results
+
+    def predict_from_file(self, file_path):
+        """Process a file with multiple text samples"""
+        texts = []
+        try:
+            if file_path.endswith('.csv'):
+                df = pd.read_csv(file_path)
+                if 'text' in df.columns:
+                    texts = df['text'].tolist()
+                else:
+                    texts = df.iloc[:, 0].tolist()
+            else:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    texts = [line.strip() for line in file if line.strip()]
+        except Exception as e:
+            print(f"Error reading file: {str(e)}")
+            return []
+        return self.predict_batch(texts)
+
+    def _iter_text_chunks(self, file_path, chunk_size):
+        """Yield lists of at most chunk_size texts from a CSV or plain-text file"""
+        if file_path.endswith('.csv'):
+            for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+                column = 'text' if 'text' in chunk.columns else chunk.columns[0]
+                yield chunk[column].tolist()
+        else:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                texts = []
+                for line in file:
+                    line = line.strip()
+                    if line:
+                        texts.append(line)
+                    if len(texts) >= chunk_size:
+                        yield texts
+                        texts = []
+                if texts:
+                    yield texts
+
+    def predict_file_streaming(self, file_path, output_path, chunk_size=10000, top_k=3):
+        """Score a file chunk by chunk and append each chunk's results to output_path"""
+        total_rows = 0
+        start_time = time.time()
+        header = True
+        try:
+            for texts in self._iter_text_chunks(file_path, chunk_size):
+                results = self.predict_batch(texts, columnar=True)
+                if not results:
+                    continue
+
+                # Top-k labels per row straight from the probability matrix
+                probs = results['probabilities']
+                labels = results['emotion_labels']
+                top_idx = np.argsort(-probs, axis=1, kind='stable')[:, :top_k]
+                top_emotions = [
+                    ', '.join(f"{labels[j]}: {probs[row, j]:.3f}" for j in top_idx[row])
+                    for row in range(len(probs))
+                ]
+
+                chunk_df = pd.DataFrame({
+                    'text': results['text'],
+                    'emotion': results['emotion'],
+                    'confidence': results['confidence'],
+                    'top_emotions': top_emotions
+                })
+                chunk_df.to_csv(output_path, mode='w' if header else 'a', header=header, index=False)
+                header = False
+
+                total_rows += len(chunk_df)
+                elapsed = time.time() - start_time
+                print(f"Scored {total_rows} rows ({total_rows / max(elapsed, 1e-9):.0f} rows/sec)")
+        except Exception as e:
+            print(f"Error during streaming prediction: {str(e)}")
+            raise
+
+        elapsed = time.time() - start_time
+        print(f"Streaming prediction completed: {total_rows} rows in {elapsed:.2f} seconds")
+        return total_rows
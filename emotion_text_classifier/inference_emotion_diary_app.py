@@ -1,15 +1,236 @@
 import sys
+import time
+
+APP_START_TIME = time.perf_counter()
+
 import pickle
-import pandas as pd
+import hashlib
 import os
 from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTextEdit,
-                             QPushButton, QComboBox, QLineEdit, QMessageBox, QFrame, QScrollArea)
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPalette, QColor, QFont
+                             QPushButton, QComboBox, QLineEdit, QMessageBox, QFrame, QScrollArea, QCheckBox,
+                             QListView, QStyledItemDelegate, QStyle, QAbstractItemView, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QProgressBar)
+from PyQt5.QtCore import (Qt, QThread, QObject, QTimer, pyqtSignal, pyqtSlot, QAbstractListModel, QModelIndex,
+                          QSize, QRect)
+from PyQt5.QtGui import QPalette, QColor, QFont, QPainter, QFontMetrics
+from diary_storage import (open_diary_store, migrate_csv_diary, summarize_rollups, export_rollup_summary,
+                           rescore_diary, SqliteDiaryStore)
+from pipeline_metrics import pipeline_metrics
+
+COMPACT_MODEL_DIR = "emotion_model_compact"
+LEMMA_TABLE_FILE = "lemma_table.pkl"
+DIARY_FILE = "emotion_diary.db"
+LEGACY_DIARY_CSV = "emotion_diary.csv"
+FIRST_PAINT_BUDGET_MS = 500
+LIVE_DEBOUNCE_MS = 400
+DIARY_PAGE_SIZE = 200
+RESCORE_BATCH_SIZE = 512
+EntryRole = Qt.UserRole + 1
+
+
+class StartupLoader(QThread):
+    """Loads the model and the diary entries off the GUI thread"""
+    model_loaded = pyqtSignal(object, object)
+    diary_loaded = pyqtSignal(int)
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.app = app
+
+    def run(self):
+        start_time = time.perf_counter()
+        model, emotion_mapping = self.app.load_models()
+        print(f"Model loaded in background in {(time.perf_counter() - start_time) * 1000:.0f} ms")
+        self.model_loaded.emit(model, emotion_mapping)
+
+        start_time = time.perf_counter()
+        entry_count = self.app.load_diary_store()
+        print(f"Diary opened in background in {(time.perf_counter() - start_time) * 1000:.0f} ms")
+        self.diary_loaded.emit(entry_count)
+
+
+class DiaryRescorer(QThread):
+    """Re-scores diary entries with the current model in batches; cancelled via requestInterruption()"""
+    progress = pyqtSignal(int, int)
+    finished_rescoring = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, diary_file, model, reverse_mapping, model_version, lemma_table=None, relabel=False,
+                 parent=None):
+        super().__init__(parent)
+        self.diary_file = diary_file
+        self.model = model
+        self.reverse_mapping = reverse_mapping
+        self.model_version = model_version
+        self.lemma_table = lemma_table
+        self.relabel = relabel
+        self.cache = None
+
+    def score_texts(self, texts):
+        """Preprocess a batch and score it with one predict_proba call"""
+        from text_preprocessing import PreprocessingCache, preprocess_text
+        if self.cache is None:
+            # Its own cache: the shared one is used from the analysis thread at the same time
+            self.cache = PreprocessingCache(max_size=RESCORE_BATCH_SIZE)
+        probs = self.model.predict_proba([preprocess_text(text, self.cache, self.lemma_table) for text in texts])
+        class_emotions = [self.reverse_mapping[c] for c in self.model.classes_]
+        return [dict(zip(class_emotions, map(float, row))) for row in probs]
+
+    def run(self):
+        # A separate connection keeps this thread off the GUI thread's store; SQLite WAL allows both.
+        # File backends have no such locking, so toggle_rescoring only starts this thread for SQLite diaries.
+        store = None
+        try:
+            store = open_diary_store(self.diary_file)
+            summary = rescore_diary(store, self.score_texts, self.model_version, batch_size=RESCORE_BATCH_SIZE,
+                                    relabel=self.relabel, progress=self.progress.emit,
+                                    is_cancelled=self.isInterruptionRequested)
+            print(f"Re-scored {summary['scored']} of {summary['pending']} entries with model {self.model_version} "
+                  f"in {summary['seconds']:.1f} s ({summary['skipped']} already up to date)")
+            self.finished_rescoring.emit(summary)
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            if store is not None:
+                store.close()
+
+
+class AnalysisWorker(QObject):
+    """Preprocesses and scores text on a dedicated thread, skipping requests that are already stale"""
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+    def __init__(self):
+        super().__init__()
+        self.model = None
+        self.reverse_mapping = {}
+        self.lemma_table = None
+        self.latest_request_id = 0  # Written by the GUI thread; requests older than this are dropped
+
+    @pyqtSlot(int, str)
+    def analyze(self, request_id, text):
+        if request_id != self.latest_request_id or self.model is None:
+            return
+        try:
+            from text_preprocessing import preprocess_text
+            processed_text = preprocess_text(text, lemma_table=self.lemma_table)
+            if request_id != self.latest_request_id:
+                return
+            probs = self.model.predict_proba([processed_text])[0]
+            emotion_probs = {self.reverse_mapping[c]: float(p) for c, p in zip(self.model.classes_, probs)}
+            top_emotions = sorted(emotion_probs.items(), key=lambda x: x[1], reverse=True)
+            self.finished.emit(request_id, {'text': text, 'emotion': top_emotions[0][0], 'top_emotions': top_emotions})
+        except Exception as e:
+            self.failed.emit(request_id, str(e))
+
+
+class DiaryListModel(QAbstractListModel):
+    """Newest-first diary entries, fetched from the store one page at a time as the view scrolls"""
+    def __init__(self, store, page_size=DIARY_PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.page_size = page_size
+        self.entries = []
+        self.exhausted = False
+        self.filters = {}
+
+    def set_filters(self, filters):
+        """Replace the active search filters and reload from the first page"""
+        self.beginResetModel()
+        self.filters = {k: v for k, v in filters.items() if v}
+        self.entries = []
+        self.exhausted = False
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.entries):
+            return None
+        entry = self.entries[index.row()]
+        if role == EntryRole:
+            return entry
+        if role == Qt.DisplayRole:
+            return f"📅 {entry.get('date', 'Unknown date')}\n📝 {entry['text']}\n Emotion: {entry['emotion']}"
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        before_id = self.entries[-1]['id'] if self.entries else None
+        if self.filters:
+            page = self.store.search(**self.filters, before_id=before_id, limit=self.page_size)
+        else:
+            page = self.store.page_before(before_id, self.page_size)
+        if len(page) < self.page_size:
+            self.exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.entries), len(self.entries) + len(page) - 1)
+            self.entries.extend(page)
+            self.endInsertRows()
+
+    def _row_of(self, entry_id):
+        return next((row for row, entry in enumerate(self.entries) if entry['id'] == entry_id), None)
+
+    def prepend_entry(self, entry):
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.entries.insert(0, entry)
+        self.endInsertRows()
+
+    def update_entry(self, entry_id, fields):
+        row = self._row_of(entry_id)
+        if row is not None:
+            self.entries[row].update(fields)
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def remove_entry(self, entry_id):
+        row = self._row_of(entry_id)
+        if row is not None:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.entries[row]
+            self.endRemoveRows()
+
+
+class DiaryEntryDelegate(QStyledItemDelegate):
+    """Paints a diary entry as a card; only rows in the viewport are ever painted"""
+    ROW_HEIGHT = 120
+
+    def paint(self, painter, option, index):
+        entry = index.data(EntryRole)
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        card = option.rect.adjusted(6, 6, -6, -6)
+        selected = option.state & QStyle.State_Selected
+        painter.setPen(QColor("#4a90e2") if selected else QColor("#bdc3c7"))
+        painter.setBrush(QColor(255, 255, 255, 240))
+        painter.drawRoundedRect(card, 8, 8)
+
+        text_rect = card.adjusted(12, 8, -12, -8)
+        line_height = QFontMetrics(option.font).lineSpacing()
+        painter.setPen(QColor("#2c3e50"))
+        painter.drawText(QRect(text_rect.left(), text_rect.top(), text_rect.width(), line_height),
+                         Qt.AlignLeft, f"📅 {entry.get('date', 'Unknown date')}")
+        body_rect = QRect(text_rect.left(), text_rect.top() + line_height,
+                          text_rect.width(), text_rect.height() - 2 * line_height)
+        body = QFontMetrics(option.font).elidedText(" ".join(entry['text'].split()), Qt.ElideRight,
+                                                    body_rect.width() * max(body_rect.height() // line_height, 1))
+        painter.drawText(body_rect, Qt.AlignLeft | Qt.TextWordWrap, f"📝 {body}")
+        painter.setPen(QColor("#34495e"))
+        painter.drawText(QRect(text_rect.left(), text_rect.bottom() - line_height, text_rect.width(), line_height),
+                         Qt.AlignLeft, f" Emotion: {entry['emotion']}")
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), self.ROW_HEIGHT)
 
 
 class EmotionDiaryApp(QMainWindow):
+    analysis_requested = pyqtSignal(int, str)
+
     def __init__(self):
         super().__init__()
         # Existing __init__ code remains unchanged
@@ -136,6 +357,10 @@ class EmotionDiaryApp(QMainWindow):
         result_layout.addWidget(self.result_label)
         layout.addWidget(result_frame)
 
+        self.live_checkbox = QCheckBox("Live analysis while typing", self)
+        self.live_checkbox.setFont(QFont("Segoe UI", 13))
+        layout.addWidget(self.live_checkbox)
+
         button_layout = QHBoxLayout()
         button_layout.setSpacing(20)
 
@@ -150,29 +375,121 @@ class EmotionDiaryApp(QMainWindow):
         self.view_button = QPushButton("👁️ View Diary", self)
         self.view_button.clicked.connect(self.view_diary)
         button_layout.addWidget(self.view_button)
+
+        self.analytics_button = QPushButton("📊 Analytics", self)
+        self.analytics_button.clicked.connect(self.view_analytics)
+        button_layout.addWidget(self.analytics_button)
         layout.addLayout(button_layout)
 
         self.model = None
         self.emotion_mapping = None
-        self.load_models()
-        self.diary_file = "emotion_diary.csv"
-        self.diary_entries = self.load_diary_entries()
-        self.update_status()
+        self.diary_file = DIARY_FILE
+        self.diary_store = None
+        self.diary_load_error = None
+        self.diary_model = None
+        self.refresh_analytics = None
+        self.model_version = None
+        self.lemma_table = None  # Loaded with the model; None lemmatizes with WordNet
+        self.current_probabilities = None
+        self.rescorer = None
+        self.first_paint_ms = None
+
+        # The window paints immediately; buttons are enabled as the background loads finish
+        self.analyze_button.setEnabled(False)
+        self.save_button.setEnabled(False)
+        self.view_button.setEnabled(False)
+        self.analytics_button.setEnabled(False)
+        self.startup_loader = StartupLoader(self)
+        self.startup_loader.model_loaded.connect(self.on_model_loaded)
+        self.startup_loader.diary_loaded.connect(self.on_diary_loaded)
+        self.startup_loader.start()
+
+        # Inference runs on its own thread; only the newest request's result is shown
+        self.request_id = 0
+        self.explicit_request_id = None
+        self.analysis_thread = QThread(self)
+        self.analysis_worker = AnalysisWorker()
+        self.analysis_worker.moveToThread(self.analysis_thread)
+        self.analysis_requested.connect(self.analysis_worker.analyze)
+        self.analysis_worker.finished.connect(self.on_analysis_finished)
+        self.analysis_worker.failed.connect(self.on_analysis_failed)
+        self.analysis_thread.start()
+
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(LIVE_DEBOUNCE_MS)
+        self.live_timer.timeout.connect(self.request_live_analysis)
+        self.text_input.textChanged.connect(self.on_text_changed)
 
         self.text_input.setLayoutDirection(Qt.LeftToRight)
         self.result_label.setLayoutDirection(Qt.LeftToRight)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint_ms is None:
+            self.first_paint_ms = (time.perf_counter() - APP_START_TIME) * 1000
+            over_budget = self.first_paint_ms > FIRST_PAINT_BUDGET_MS
+            if pipeline_metrics.enabled:
+                pipeline_metrics.observe('app.first_paint', self.first_paint_ms / 1000)
+                pipeline_metrics.increment('app.first_paint_over_budget', int(over_budget))
+            budget_note = "OVER" if over_budget else "within"
+            print(f"Time to first paint: {self.first_paint_ms:.0f} ms ({budget_note} {FIRST_PAINT_BUDGET_MS} ms budget)")
+
+    def on_model_loaded(self, model, emotion_mapping):
+        self.model = model
+        self.emotion_mapping = emotion_mapping
+        if self.emotion_mapping:
+            self.reverse_mapping = {v: k for k, v in self.emotion_mapping.items()}
+            self.analysis_worker.reverse_mapping = self.reverse_mapping
+            self.analysis_worker.lemma_table = self.lemma_table
+            self.analysis_worker.model = self.model
+        self.update_status()
+        self.analyze_button.setEnabled(bool(self.model and self.emotion_mapping))
+
+    def on_diary_loaded(self, entry_count):
+        if self.diary_load_error:
+            self.statusBar().showMessage(f"Diary error: {self.diary_load_error}")
+        if self.diary_store is None:
+            return  # Save, View and Analytics all need the store
+        self.save_button.setEnabled(True)
+        self.view_button.setEnabled(True)
+        self.analytics_button.setEnabled(True)
+
     # Existing methods (load_models, update_status, analyze_sentiment, confirm_and_save, etc.) remain unchanged
     def load_models(self):
+        """Load the model and emotion mapping; runs on the StartupLoader thread"""
         try:
-            with open("emotion_model.pkl", 'rb') as f:
-                self.model = pickle.load(f)
-            with open("emotion_mapping.pkl", 'rb') as f:
-                self.emotion_mapping = pickle.load(f)
-            self.reverse_mapping = {v: k for k, v in self.emotion_mapping.items()}
+            if os.path.isdir(COMPACT_MODEL_DIR):
+                # Memory-mapped arrays load near-instantly and avoid importing sklearn
+                from emotion_inference_engine import load_compact_model
+                model = load_compact_model(COMPACT_MODEL_DIR)
+                emotion_mapping = model.emotion_mapping
+                self.model_version = model.model_version
+            else:
+                with open("emotion_model.pkl", 'rb') as f:
+                    model_bytes = f.read()
+                model = pickle.loads(model_bytes)
+                with open("emotion_mapping.pkl", 'rb') as f:
+                    emotion_mapping = pickle.load(f)
+                self.model_version = hashlib.sha1(model_bytes).hexdigest()[:12]
             print("Model loaded successfully")
+            self.load_lemma_table()
+            return model, emotion_mapping
         except Exception as e:
             print(f"Error loading model: {e}")
+            return None, None
+
+    def load_lemma_table(self):
+        """Replace per-token WordNet lemmatization with the lemma table saved next to the model, if present"""
+        if not os.path.exists(LEMMA_TABLE_FILE):
+            print("No lemma table found, lemmatizing with WordNet")
+            return
+        try:
+            from text_preprocessing import LemmaTable
+            self.lemma_table = LemmaTable.load(LEMMA_TABLE_FILE)
+            print(f"Lemma table loaded with {len(self.lemma_table.table)} tokens")
+        except Exception as e:
+            print(f"Error loading lemma table, lemmatizing with WordNet: {e}")
 
     def update_status(self):
         status_text = "Model ready for use" if (self.model and self.emotion_mapping) else "Model not loaded"
@@ -191,15 +508,58 @@ class EmotionDiaryApp(QMainWindow):
             QMessageBox.critical(self, "Error", "Please enter text for analysis")
             return
 
-        try:
-            prediction = self.model.predict([text])[0]
-            emotion = self.reverse_mapping[prediction]
+        self.result_label.setText("Analyzing...")
+        self.explicit_request_id = self.submit_analysis(text)
+
+    def submit_analysis(self, text):
+        """Queue text for analysis on the worker thread, superseding any pending request"""
+        self.request_id += 1
+        self.analysis_worker.latest_request_id = self.request_id
+        self.analysis_requested.emit(self.request_id, text)
+        return self.request_id
+
+    def on_text_changed(self):
+        if self.live_checkbox.isChecked():
+            self.live_timer.start()  # Restarting the single-shot timer debounces keystrokes
+
+    def request_live_analysis(self):
+        text = self.text_input.toPlainText().strip()
+        if text and self.model and self.emotion_mapping:
+            self.submit_analysis(text)
+
+    def on_analysis_finished(self, request_id, result):
+        if request_id != self.request_id:
+            return
+        emotion = result['emotion']
+        self.current_emotion = emotion
+        self.current_text = result['text']
+        self.current_probabilities = dict(result['top_emotions'])
+        if self.live_checkbox.isChecked():
+            top_text = ", ".join(f"{e} ({p:.2f})" for e, p in result['top_emotions'][:3])
+            self.result_label.setText(f"Detected Emotion: {emotion}\nTop emotions: {top_text}")
+        else:
             self.result_label.setText(f"Detected Emotion: {emotion}")
-            self.current_emotion = emotion
-            self.current_text = text
-            print(f"Analyzed: Emotion = {emotion}, Text = {text}")
-        except Exception as e:
-            QMessageBox.critical(self, "Analysis Error", str(e))
+        print(f"Analyzed: Emotion = {emotion}, Text = {result['text']}")
+
+    def on_analysis_failed(self, request_id, message):
+        if request_id != self.request_id:
+            return
+        if request_id == self.explicit_request_id:
+            QMessageBox.critical(self, "Analysis Error", message)
+        else:
+            print(f"Live analysis error: {message}")
+
+    def closeEvent(self, event):
+        self.analysis_thread.quit()
+        self.analysis_thread.wait()
+        if self.rescorer is not None and self.rescorer.isRunning():
+            self.rescorer.requestInterruption()  # Batches already saved are kept; the next run resumes
+            self.rescorer.wait()
+        if self.diary_store:
+            self.diary_store.close()
+        if pipeline_metrics.enabled:
+            pipeline_metrics.log_summary()
+        super().closeEvent(event)
 
     def confirm_and_save(self):
         print("Save button clicked")
@@ -307,33 +667,37 @@ class EmotionDiaryApp(QMainWindow):
 
         current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         entry = {"text": self.current_text, "emotion": self.current_emotion, "date": current_date}
-        self.diary_entries.append(entry)
-        self.save_diary_entries()
+        try:
+            entry['id'] = self.diary_store.add(entry)
+            if self.current_probabilities:
+                # The analysis that produced this entry is its score, so re-scoring can skip it
+                predicted_emotion = max(self.current_probabilities, key=self.current_probabilities.get)
+                self.diary_store.save_scores([{'id': entry['id'], 'text': entry['text'],
+                                               'model_version': self.model_version, 'emotion': predicted_emotion,
+                                               'probabilities': self.current_probabilities}])
+        except Exception as e:
+            QMessageBox.critical(self, "Save Error", str(e))
+            return
+        if self.diary_model is not None and not self.diary_model.filters:
+            self.diary_model.prepend_entry(entry)
+        if self.refresh_analytics is not None:
+            self.refresh_analytics()
         QMessageBox.information(self, "Saved", "Entry saved to diary successfully")
         print(f"Saved: Text = {self.current_text}, Emotion = {self.current_emotion}, Date = {current_date}")
 
-    def load_diary_entries(self):
-        if os.path.exists(self.diary_file):
-            try:
-                df = pd.read_csv(self.diary_file, encoding='utf-8')
-                if 'date' not in df.columns:
-                    df['date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                return df.to_dict('records')
-            except Exception as e:
-                print(f"Error loading diary: {e}")
-                return []
-        return []
-
-    def save_diary_entries(self):
+    def load_diary_store(self):
+        """Open the diary store, migrating the legacy CSV once; runs on the StartupLoader thread"""
         try:
-            df = pd.DataFrame(self.diary_entries, columns=["text", "emotion", "date"])
-            df.to_csv(self.diary_file, index=False, encoding='utf-8')
-            print("Diary entries saved to CSV")
+            self.diary_store = open_diary_store(self.diary_file)
+            migrate_csv_diary(LEGACY_DIARY_CSV, self.diary_store)
+            return self.diary_store.count()
         except Exception as e:
-            QMessageBox.critical(self, "Save Error", str(e))
+            print(f"Error loading diary: {e}")
+            self.diary_load_error = str(e)
+            return 0
 
     def view_diary(self):
-        """Display all diary entries in a scrollable window with edit and delete options"""
+        """Display diary entries in a lazily paged list window with edit and delete options"""
         diary_window = QMainWindow(self)
         diary_window.setWindowTitle("My Diary")
         diary_window.setGeometry(150, 150, 800, 600)
@@ -402,56 +766,82 @@ class EmotionDiaryApp(QMainWindow):
         title_label.setStyleSheet("color: #2c3e50; text-shadow: 1px 1px 3px rgba(0, 0, 0, 0.2);")
         layout.addWidget(title_label)
 
-        scroll_area = QScrollArea()
-        scroll_content = QWidget()
-        scroll_layout = QVBoxLayout(scroll_content)
-        scroll_layout.setAlignment(Qt.AlignTop)
-        scroll_layout.setContentsMargins(10, 10, 10, 10)
-        scroll_layout.setSpacing(20)
-
-        if not self.diary_entries:
-            no_entries_label = QLabel("No entries in the diary yet.", diary_window)
-            no_entries_label.setStyleSheet("color: #7f8c8d; font-size: 16px;")
-            scroll_layout.addWidget(no_entries_label)
-        else:
-            for idx, entry in enumerate(reversed(self.diary_entries)):
-                entry_frame = QFrame()
-                entry_layout = QVBoxLayout(entry_frame)
-                entry_layout.setSpacing(10)
-
-                date_text = entry.get('date', 'Unknown date')
-                text = entry['text']
-                emotion = entry['emotion']
-
-                entry_label = QLabel(f"📅 {date_text}\n📝 {text}\n Emotion: {emotion}", diary_window)
-                entry_label.setStyleSheet("""
-                    color: #2c3e50;
-                    font-size: 14px;
-                    background-color: rgba(255, 255, 255, 0.9);
-                    padding: 10px;
-                    border: 1px solid #bdc3c7;
-                    border-radius: 8px;
-                """)
-                entry_layout.addWidget(entry_label)
-
-                button_layout = QHBoxLayout()
-                edit_button = QPushButton("✏️ Edit", diary_window)
-                edit_button.setObjectName("editButton")
-                edit_button.clicked.connect(lambda ch, i=len(self.diary_entries) - 1 - idx: self.edit_entry(i, diary_window))
-                button_layout.addWidget(edit_button)
-
-                delete_button = QPushButton("🗑️ Delete", diary_window)
-                delete_button.setObjectName("deleteButton")
-                delete_button.clicked.connect(lambda ch, i=len(self.diary_entries) - 1 - idx: self.delete_entry(i, diary_window))
-                button_layout.addWidget(delete_button)
-
-                entry_layout.addLayout(button_layout)
-                scroll_layout.addWidget(entry_frame)
-
-        scroll_content.setLayout(scroll_layout)
-        scroll_area.setWidget(scroll_content)
-        scroll_area.setWidgetResizable(True)
-        layout.addWidget(scroll_area)
+        # Filter bar; queries go to the store's indexes and the list reloads page by page
+        filter_layout = QHBoxLayout()
+        filter_layout.setSpacing(10)
+        emotion_filter = QComboBox(diary_window)
+        emotion_filter.addItem("All emotions", "")
+        for emotion in sorted(self.emotion_mapping or {}):
+            emotion_filter.addItem(emotion, emotion)
+        filter_layout.addWidget(emotion_filter)
+        date_from_filter = QLineEdit(diary_window)
+        date_from_filter.setPlaceholderText("From (YYYY-MM-DD)")
+        filter_layout.addWidget(date_from_filter)
+        date_to_filter = QLineEdit(diary_window)
+        date_to_filter.setPlaceholderText("To (YYYY-MM-DD)")
+        filter_layout.addWidget(date_to_filter)
+        keyword_filter = QLineEdit(diary_window)
+        keyword_filter.setPlaceholderText("Search text...")
+        filter_layout.addWidget(keyword_filter)
+        layout.addLayout(filter_layout)
+
+        no_entries_label = QLabel("No entries in the diary yet.", diary_window)
+        no_entries_label.setStyleSheet("color: #7f8c8d; font-size: 16px;")
+        no_entries_label.setVisible(self.diary_store.count() == 0)
+        layout.addWidget(no_entries_label)
+
+        # Model/view: rows are fetched from the store page by page and painted only when visible
+        self.diary_model = DiaryListModel(self.diary_store, parent=diary_window)
+        diary_list = QListView(diary_window)
+        diary_list.setModel(self.diary_model)
+        diary_list.setItemDelegate(DiaryEntryDelegate(diary_list))
+        diary_list.setUniformItemSizes(True)
+        diary_list.setSelectionMode(QAbstractItemView.SingleSelection)
+        diary_list.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        diary_list.setStyleSheet("QListView { background: transparent; border: none; }")
+        diary_list.doubleClicked.connect(lambda index: self.edit_entry(index.data(EntryRole)['id'], diary_window))
+        self.diary_model.rowsInserted.connect(lambda *args: no_entries_label.setVisible(False))
+        self.diary_model.rowsRemoved.connect(
+            lambda *args: no_entries_label.setVisible(self.diary_model.rowCount() == 0))
+        layout.addWidget(diary_list)
+
+        def apply_filters():
+            self.diary_model.set_filters({
+                'emotion': emotion_filter.currentData(),
+                'date_from': self._valid_date(date_from_filter.text()),
+                'date_to': self._valid_date(date_to_filter.text()),
+                'keyword': keyword_filter.text().strip()
+            })
+            self.diary_model.fetchMore()
+            if self.diary_model.filters:
+                no_entries_label.setText("No entries match these filters.")
+            else:
+                no_entries_label.setText("No entries in the diary yet.")
+            no_entries_label.setVisible(self.diary_model.rowCount() == 0)
+
+        filter_timer = QTimer(diary_window)
+        filter_timer.setSingleShot(True)
+        filter_timer.setInterval(250)
+        filter_timer.timeout.connect(apply_filters)
+        emotion_filter.currentIndexChanged.connect(lambda *args: filter_timer.start())
+        for line_edit in (date_from_filter, date_to_filter, keyword_filter):
+            line_edit.textChanged.connect(lambda *args: filter_timer.start())
+
+        entry_button_layout = QHBoxLayout()
+        edit_button = QPushButton("✏️ Edit", diary_window)
+        edit_button.setObjectName("editButton")
+        edit_button.clicked.connect(lambda: self.edit_selected_entry(diary_list, diary_window))
+        entry_button_layout.addWidget(edit_button)
+
+        delete_button = QPushButton("🗑️ Delete", diary_window)
+        delete_button.setObjectName("deleteButton")
+        delete_button.clicked.connect(lambda: self.delete_selected_entry(diary_list, diary_window))
+        entry_button_layout.addWidget(delete_button)
+        layout.addLayout(entry_button_layout)
+
+        rescore_progress = QProgressBar(diary_window)
+        rescore_progress.setVisible(False)
+        layout.addWidget(rescore_progress)
 
         button_layout = QHBoxLayout()
         button_layout.setSpacing(15)
@@ -460,6 +850,12 @@ class EmotionDiaryApp(QMainWindow):
         export_button.clicked.connect(lambda: self.export_diary_to_text(diary_window))
         button_layout.addWidget(export_button)
 
+        rescore_button = QPushButton("🔄 Re-score with Current Model", diary_window)
+        rescore_button.setEnabled(self.model is not None)
+        rescore_button.clicked.connect(
+            lambda: self.toggle_rescoring(diary_window, rescore_button, rescore_progress))
+        button_layout.addWidget(rescore_button)
+
         close_button = QPushButton("Close", diary_window)
         close_button.clicked.connect(diary_window.close)
         button_layout.addWidget(close_button)
@@ -467,9 +863,93 @@ class EmotionDiaryApp(QMainWindow):
         layout.addLayout(button_layout)
         diary_window.show()
 
-    def edit_entry(self, index, diary_window):
+    def toggle_rescoring(self, diary_window, rescore_button, rescore_progress):
+        """Start re-scoring all entries not yet scored by the current model, or cancel a running job"""
+        if self.rescorer is not None and self.rescorer.isRunning():
+            self.rescorer.requestInterruption()
+            rescore_button.setEnabled(False)
+            return
+        if not isinstance(self.diary_store, SqliteDiaryStore):
+            # A second writer on a journal or CSV file would overwrite the GUI's own writes
+            QMessageBox.warning(diary_window, "Re-score Diary",
+                                "Background re-scoring needs a SQLite diary (.db); this diary uses a file backend.")
+            return
+
+        reply = QMessageBox.question(
+            diary_window, "Re-score Diary",
+            f"Re-score entries with model {self.model_version}?\n\n"
+            "Yes: also replace each entry's emotion with the new prediction.\n"
+            "No: only store the new probabilities.",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.No)
+        if reply == QMessageBox.Cancel:
+            return
+
+        self.rescorer = DiaryRescorer(self.diary_file, self.model, self.reverse_mapping, self.model_version,
+                                      lemma_table=self.lemma_table, relabel=reply == QMessageBox.Yes, parent=self)
+
+        def on_progress(done, total):
+            rescore_progress.setMaximum(max(total, 1))
+            rescore_progress.setValue(done)
+            rescore_progress.setFormat(f"Re-scoring: {done} / {total}")
+
+        def on_finished(summary):
+            rescore_progress.setVisible(False)
+            rescore_button.setText("🔄 Re-score with Current Model")
+            rescore_button.setEnabled(True)
+            if summary['scored'] and self.rescorer.relabel:
+                if self.diary_model is not None:
+                    self.diary_model.set_filters(self.diary_model.filters)
+                    self.diary_model.fetchMore()
+                if self.refresh_analytics is not None:
+                    self.refresh_analytics()
+            state = "cancelled" if summary['cancelled'] else "finished"
+            QMessageBox.information(diary_window, "Re-scoring",
+                                    f"Re-scoring {state}: {summary['scored']} entries scored, "
+                                    f"{summary['skipped']} already up to date.")
+
+        def on_failed(message):
+            rescore_progress.setVisible(False)
+            rescore_button.setText("🔄 Re-score with Current Model")
+            rescore_button.setEnabled(True)
+            QMessageBox.critical(diary_window, "Re-scoring Error", message)
+
+        self.rescorer.progress.connect(on_progress)
+        self.rescorer.finished_rescoring.connect(on_finished)
+        self.rescorer.failed.connect(on_failed)
+        rescore_progress.setValue(0)
+        rescore_progress.setVisible(True)
+        rescore_button.setText("⏹ Cancel Re-scoring")
+        self.rescorer.start()
+
+    @staticmethod
+    def _valid_date(text):
+        text = text.strip()
+        try:
+            datetime.strptime(text, "%Y-%m-%d")
+            return text
+        except ValueError:
+            return ""  # Incomplete or invalid dates are ignored while typing
+
+    def _selected_entry_id(self, diary_list, diary_window):
+        index = diary_list.currentIndex()
+        if not index.isValid():
+            QMessageBox.information(diary_window, "No Selection", "Please select an entry first")
+            return None
+        return index.data(EntryRole)['id']
+
+    def edit_selected_entry(self, diary_list, diary_window):
+        entry_id = self._selected_entry_id(diary_list, diary_window)
+        if entry_id is not None:
+            self.edit_entry(entry_id, diary_window)
+
+    def delete_selected_entry(self, diary_list, diary_window):
+        entry_id = self._selected_entry_id(diary_list, diary_window)
+        if entry_id is not None:
+            self.delete_entry(entry_id, diary_window)
+
+    def edit_entry(self, entry_id, diary_window):
         """Open a window to edit an existing diary entry"""
-        entry = self.diary_entries[index]
+        entry = self.diary_store.get(entry_id)
         edit_window = QMainWindow(self)
         edit_window.setWindowTitle("Edit Entry")
         edit_window.setGeometry(200, 200, 450, 300)
@@ -537,41 +1017,168 @@ class EmotionDiaryApp(QMainWindow):
         layout.addWidget(emotion_combo)
 
         save_button = QPushButton("Save Changes", edit_window)
-        save_button.clicked.connect(lambda: self.save_edited_entry(index, text_edit.toPlainText(), emotion_combo.currentText(), edit_window, diary_window))
+        save_button.clicked.connect(lambda: self.save_edited_entry(entry_id, text_edit.toPlainText(), emotion_combo.currentText(), edit_window, diary_window))
         layout.addWidget(save_button)
 
         edit_window.show()
 
-    def save_edited_entry(self, index, new_text, new_emotion, edit_window, diary_window):
-        """Save the edited entry and refresh the diary view"""
+    def save_edited_entry(self, entry_id, new_text, new_emotion, edit_window, diary_window):
+        """Save the edited entry and update its row in the diary view"""
         if not new_text.strip():
             QMessageBox.critical(edit_window, "Error", "Text cannot be empty")
             return
 
-        self.diary_entries[index]['text'] = new_text
-        self.diary_entries[index]['emotion'] = new_emotion
-        self.diary_entries[index]['date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Update timestamp
-        self.save_diary_entries()
+        changes = {'text': new_text, 'emotion': new_emotion,
+                   'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}  # Update timestamp
+        try:
+            self.diary_store.update(entry_id, changes)
+        except Exception as e:
+            QMessageBox.critical(edit_window, "Save Error", str(e))
+            return
+        if self.diary_model is not None:
+            self.diary_model.update_entry(entry_id, changes)
+        if self.refresh_analytics is not None:
+            self.refresh_analytics()
         QMessageBox.information(edit_window, "Success", "Entry updated successfully")
         edit_window.close()
-        diary_window.close()
-        self.view_diary()  # Refresh the diary view
 
-    def delete_entry(self, index, diary_window):
+    def delete_entry(self, entry_id, diary_window):
         """Delete an entry from the diary"""
         reply = QMessageBox.question(diary_window, "Confirm Delete", "Are you sure you want to delete this entry?",
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
-            del self.diary_entries[index]
-            self.save_diary_entries()
-            diary_window.close()
-            self.view_diary()  # Refresh the diary view
+            try:
+                self.diary_store.delete(entry_id)
+            except Exception as e:
+                QMessageBox.critical(diary_window, "Delete Error", str(e))
+                return
+            if self.diary_model is not None:
+                self.diary_model.remove_entry(entry_id)
+            if self.refresh_analytics is not None:
+                self.refresh_analytics()
+
+    def view_analytics(self):
+        """Show per-day/week/month emotion counts read from the store's incrementally maintained rollups"""
+        analytics_window = QMainWindow(self)
+        analytics_window.setWindowTitle("Emotion Analytics")
+        analytics_window.setGeometry(170, 170, 800, 600)
+        analytics_window.setStyleSheet("""
+            QMainWindow {
+                background: qlineargradient(x1:0, y1:0, x2:1, y2:1, stop:0 #f5f7fa, stop:1 #c9d6e5);
+            }
+            QLabel {
+                color: #34495e;
+                font-family: 'Segoe UI', Arial;
+                font-size: 15px;
+                padding: 5px;
+            }
+            QTableWidget {
+                background-color: rgba(255, 255, 255, 0.98);
+                color: #2c3e50;
+                border: 1px solid #d5dce5;
+                border-radius: 10px;
+                font-size: 14px;
+            }
+            QPushButton {
+                background: qlineargradient(x1:0, y1:0, x2:1, y2:1, stop:0 #4a90e2, stop:1 #357abd);
+                color: white;
+                border-radius: 12px;
+                padding: 10px;
+                min-width: 130px;
+                font-family: 'Segoe UI', Arial;
+                font-size: 15px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background: qlineargradient(x1:0, y1:0, x2:1, y2:1, stop:0 #357abd, stop:1 #2a6395);
+            }
+        """)
+
+        central_widget = QWidget()
+        analytics_window.setCentralWidget(central_widget)
+        layout = QVBoxLayout(central_widget)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(15)
+
+        title_label = QLabel("📊 Emotion Analytics", analytics_window)
+        title_label.setAlignment(Qt.AlignCenter)
+        title_label.setFont(QFont("Segoe UI", 24, QFont.Bold))
+        layout.addWidget(title_label)
+
+        granularity_combo = QComboBox(analytics_window)
+        for label, granularity in (("Daily", 'day'), ("Weekly", 'week'), ("Monthly", 'month')):
+            granularity_combo.addItem(label, granularity)
+        layout.addWidget(granularity_combo)
+
+        trend_label = QLabel(analytics_window)
+        trend_label.setWordWrap(True)
+        layout.addWidget(trend_label)
+
+        table = QTableWidget(analytics_window)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(table)
+
+        def refresh():
+            granularity = granularity_combo.currentData()
+            emotions, rows = summarize_rollups(self.diary_store.emotion_rollups(granularity))
+            columns = ['bucket', *emotions, 'total', 'dominant']
+            rows = rows[::-1]  # Most recent period first
+            table.clear()
+            table.setColumnCount(len(columns))
+            table.setRowCount(len(rows))
+            table.setHorizontalHeaderLabels([column.capitalize() for column in columns])
+            for row_index, row in enumerate(rows):
+                for column_index, column in enumerate(columns):
+                    table.setItem(row_index, column_index, QTableWidgetItem(str(row[column])))
+            if not rows:
+                trend_label.setText("No entries in the diary yet.")
+                return
+            totals = {emotion: sum(row[emotion] for row in rows) for emotion in emotions}
+            overall = sum(totals.values())
+            shares = ", ".join(f"{emotion} {count / overall:.0%}"
+                               for emotion, count in sorted(totals.items(), key=lambda item: -item[1]))
+            latest = rows[0]
+            trend_label.setText(f"Latest period {latest['bucket']}: {latest['total']} entries "
+                                f"({latest['change']:+d} vs previous), mostly {latest['dominant']}.\n"
+                                f"Overall: {shares}")
+
+        def export():
+            granularity = granularity_combo.currentData()
+            path = f"emotion_summary_{granularity}.csv"
+            try:
+                export_rollup_summary(self.diary_store, granularity, path)
+                QMessageBox.information(analytics_window, "Exported", f"Summary exported successfully to '{path}'")
+            except Exception as e:
+                QMessageBox.critical(analytics_window, "Export Error", str(e))
+
+        def on_destroyed(*args):
+            self.refresh_analytics = None
+
+        granularity_combo.currentIndexChanged.connect(lambda *args: refresh())
+        analytics_window.setAttribute(Qt.WA_DeleteOnClose)
+        analytics_window.destroyed.connect(on_destroyed)
+        self.refresh_analytics = refresh
+
+        button_layout = QHBoxLayout()
+        button_layout.setSpacing(15)
+        export_button = QPushButton("📥 Export Summary (CSV)", analytics_window)
+        export_button.clicked.connect(export)
+        button_layout.addWidget(export_button)
+        close_button = QPushButton("Close", analytics_window)
+        close_button.clicked.connect(analytics_window.close)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        refresh()
+        analytics_window.show()
 
     def export_diary_to_text(self, parent_window):
         try:
             with open("my_diary.txt", 'w', encoding='utf-8') as f:
                 f.write("════════════════ Emotion Diary ════════════════\n\n")
-                for entry in reversed(self.diary_entries):
+                for entry in self.diary_store.iter_entries():
                     date_text = entry.get('date', 'Unknown date')
                     f.write(f"📅 Date: {date_text}\n")
                     f.write(f"📝 Text: {entry['text']}\n")
@@ -0,0 +1,158 @@
+"""Load generator for emotion_inference_server.py: latency percentiles and throughput vs single-row scoring"""
+import csv
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from emotion_inference_server import InferenceServer, load_predictor
+
+
+def load_texts(path, n_texts):
+    """Read n_texts distinct texts from the first column of a CSV or from a text file.
+    When the file has fewer, numbered copies are added so no request is a preprocessing cache hit."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            texts = [row[0] for row in csv.reader(f) if row][1:]
+        else:
+            texts = [line.strip() for line in f if line.strip()]
+    texts = list(dict.fromkeys(texts))
+    if not texts:
+        raise ValueError(f"No texts found in {path}")
+    if len(texts) < n_texts:
+        print(f"Only {len(texts)} distinct texts in {path}, adding numbered copies to reach {n_texts}")
+    return [texts[i % len(texts)] if i < len(texts) else f"{texts[i % len(texts)]} #{i // len(texts)}"
+            for i in range(n_texts)]
+
+
+def clear_caches(predictor):
+    """Drop preprocessed texts so one scenario's requests are not cache hits in the next"""
+    predictor.cache.clear()
+
+
+def summarize(name, latencies, elapsed, extra=None):
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'name': name,
+        'requests': len(latencies),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'throughput_rps': len(latencies) / elapsed,
+        **(extra or {})
+    }
+
+
+def run_single_row_baseline(predictor, texts):
+    """What each tool does today: one EmotionPredictor.predict call per row, in process"""
+    latencies = []
+    start_time = time.perf_counter()
+    for text in texts:
+        request_start = time.perf_counter()
+        predictor.predict(text)
+        latencies.append(time.perf_counter() - request_start)
+    return summarize('in-process predict (single row)', latencies, time.perf_counter() - start_time)
+
+
+async def _post_predict(reader, writer, host, text):
+    body = json.dumps({'text': text}).encode('utf-8')
+    writer.write(f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    response = await reader.readexactly(length)
+    if b' 200 ' not in status_line:
+        raise RuntimeError(f"Server error: {status_line!r} {response[:200]!r}")
+    return json.loads(response)
+
+
+async def run_load(texts, concurrency, host='127.0.0.1', port=8765, unix_path=None):
+    """Send every text as its own request from concurrency keep-alive connections; return per-request latencies"""
+    latencies = []
+    position = 0
+
+    async def client():
+        nonlocal position
+        if unix_path:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while position < len(texts):
+                text = texts[position]
+                position += 1
+                request_start = time.perf_counter()
+                await _post_predict(reader, writer, host, text)
+                latencies.append(time.perf_counter() - request_start)
+        finally:
+            writer.close()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start_time
+
+
+async def run_server_benchmark(predictor, texts, concurrency, max_batch_size, max_wait_ms):
+    """Start an in-process server on an ephemeral port and drive it with the load generator"""
+    server = InferenceServer(predictor, max_batch_size, max_wait_ms)
+    listener = await server.start('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        latencies, elapsed = await run_load(texts, concurrency, port=port)
+    finally:
+        await server.stop()
+    stats = server.batcher.stats()
+    name = f"server batch<={max_batch_size} wait={max_wait_ms:g}ms"
+    return summarize(name, latencies, elapsed, {'concurrency': concurrency,
+                                                'mean_batch_size': stats['mean_batch_size']})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test for the micro-batching inference server")
+    parser.add_argument('--texts', default='prediction_results.csv')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--pickle', default='emotion_model.pkl')
+    parser.add_argument('--mapping', default='emotion_mapping.pkl')
+    parser.add_argument('--compact-dir', help="benchmark the compact NumPy model in this directory instead")
+    parser.add_argument('--lemma-table', default='lemma_table.pkl', help="used when present; WordNet otherwise")
+    parser.add_argument('--url', help="drive an already running server (host:port) instead of an in-process one")
+    parser.add_argument('--unix', help="drive an already running server on this Unix socket")
+    parser.add_argument('--json', help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    texts = load_texts(args.texts, args.requests)
+    if args.url or args.unix:
+        host, _, port = (args.url or '127.0.0.1:0').rpartition(':')
+        latencies, elapsed = asyncio.run(run_load(texts, args.concurrency, host, int(port), args.unix))
+        report = [summarize(f"server at {args.unix or args.url}", latencies, elapsed,
+                            {'concurrency': args.concurrency})]
+    else:
+        # One predictor for every scenario, so only the serving strategy differs
+        predictor = load_predictor(args.pickle, args.mapping, args.lemma_table, args.compact_dir)
+        predictor.predict(texts[0])  # Warm-up: lazy NLTK loading is not part of the measurement
+
+        report = []
+        for scenario in (lambda: run_single_row_baseline(predictor, texts),
+                         lambda: asyncio.run(run_server_benchmark(predictor, texts, args.concurrency, 1, 0)),
+                         lambda: asyncio.run(run_server_benchmark(predictor, texts, args.concurrency,
+                                                                  args.max_batch_size, args.max_wait_ms))):
+            clear_caches(predictor)
+            report.append(scenario())
+
+    print(f"{'Scenario':<38} {'Requests':>8} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>9} {'batch':>6}")
+    for row in report:
+        print(f"{row['name']:<38} {row['requests']:>8} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+              f"{row['throughput_rps']:>9.0f} {row.get('mean_batch_size', 1):>6.1f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
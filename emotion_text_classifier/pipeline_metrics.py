@@ -0,0 +1,181 @@
+"""Opt-in per-stage instrumentation of the preprocessing, prediction and training hot paths"""
+import os
+import time
+import bisect
+import threading
+
+
+# Call sites check pipeline_metrics.enabled before reading the clock, so the disabled cost is one attribute lookup.
+class PipelineMetrics:
+    """Per-stage wall-time histograms, event counters and batch-size histograms with Prometheus text export"""
+    TIME_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, 120, 600, float('inf'))
+    BATCH_BUCKETS = (1, 8, 32, 128, 512, 2048, 8192, 32768, 131072, float('inf'))
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._dump_timer = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.batches = {}
+            self.counters = {}
+            self.started_at = time.time()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    @staticmethod
+    def _observe(histograms, name, value, buckets):
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = {'count': 0, 'sum': 0.0, 'buckets': [0] * len(buckets)}
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['buckets'][bisect.bisect_left(buckets, value)] += 1
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._observe(self.stages, stage, seconds, self.TIME_BUCKETS)
+
+    def observe_batch(self, name, size):
+        with self._lock:
+            self._observe(self.batches, name, size, self.BATCH_BUCKETS)
+
+    def increment(self, event, amount=1):
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+
+    def drain(self):
+        """Hand over the raw histograms and counters and start from zero; a worker process returns these
+        with its results so the parent can merge them"""
+        with self._lock:
+            state = {'stages': self.stages, 'batches': self.batches, 'counters': self.counters}
+            self.stages, self.batches, self.counters = {}, {}, {}
+        return state
+
+    def merge(self, state):
+        """Add the histograms and counters drained from another PipelineMetrics"""
+        with self._lock:
+            for own, other in ((self.stages, state['stages']), (self.batches, state['batches'])):
+                for name, histogram in other.items():
+                    target = own.get(name)
+                    if target is None:
+                        own[name] = {'count': histogram['count'], 'sum': histogram['sum'],
+                                     'buckets': list(histogram['buckets'])}
+                        continue
+                    target['count'] += histogram['count']
+                    target['sum'] += histogram['sum']
+                    target['buckets'] = [a + b for a, b in zip(target['buckets'], histogram['buckets'])]
+            for event, count in state['counters'].items():
+                self.counters[event] = self.counters.get(event, 0) + count
+
+    @staticmethod
+    def _quantile(histogram, buckets, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        target = q * histogram['count']
+        cumulative = 0
+        for bound, count in zip(buckets, histogram['buckets']):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return buckets[-1]
+
+    def snapshot(self):
+        """Copy of all metrics; percentiles are histogram bucket upper bounds"""
+        with self._lock:
+            stages = {
+                name: {
+                    'count': h['count'],
+                    'total_s': h['sum'],
+                    'mean_ms': h['sum'] / h['count'] * 1000,
+                    'p50_ms': self._quantile(h, self.TIME_BUCKETS, 0.5) * 1000,
+                    'p99_ms': self._quantile(h, self.TIME_BUCKETS, 0.99) * 1000
+                }
+                for name, h in self.stages.items()
+            }
+            batches = {
+                name: {'count': h['count'], 'items': int(h['sum']), 'mean_size': h['sum'] / h['count'],
+                       'p50_size': self._quantile(h, self.BATCH_BUCKETS, 0.5)}
+                for name, h in self.batches.items()
+            }
+            counters = dict(self.counters)
+        hits = counters.get('preprocess_text.cache_hits', 0)
+        lookups = hits + counters.get('preprocess_text.cache_misses', 0)
+        return {
+            'uptime_s': time.time() - self.started_at,
+            'stages': stages,
+            'batches': batches,
+            'counters': counters,
+            'preprocess_cache_hit_rate': hits / lookups if lookups else None
+        }
+
+    def log_summary(self):
+        snapshot = self.snapshot()
+        print(f"Pipeline metrics after {snapshot['uptime_s']:.1f} seconds:")
+        for name, stage in sorted(snapshot['stages'].items(), key=lambda item: -item[1]['total_s']):
+            print(f"  {name:<32} {stage['count']:>9} calls {stage['total_s']:>9.3f} s total "
+                  f"{stage['mean_ms']:>9.4f} ms mean  p99 <= {stage['p99_ms']:g} ms")
+        for name, batch in snapshot['batches'].items():
+            print(f"  batch {name:<26} {batch['count']:>9} batches {batch['mean_size']:>9.1f} mean size")
+        if snapshot['preprocess_cache_hit_rate'] is not None:
+            print(f"  preprocess_text cache hit rate: {snapshot['preprocess_cache_hit_rate']:.2%}")
+
+    def to_prometheus(self, prefix='emotion_pipeline'):
+        """Render the metrics in the Prometheus text exposition format"""
+        def bound(value):
+            return '+Inf' if value == float('inf') else repr(float(value))
+
+        def histogram_lines(metric, label, histograms, buckets):
+            lines = [f"# TYPE {metric} histogram"]
+            for name, h in sorted(histograms.items()):
+                cumulative = 0
+                for upper, count in zip(buckets, h['buckets']):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound(upper)}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {h["sum"]}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {h["count"]}')
+            return lines
+
+        with self._lock:
+            lines = histogram_lines(f'{prefix}_stage_seconds', 'stage', self.stages, self.TIME_BUCKETS)
+            lines += histogram_lines(f'{prefix}_batch_size', 'batch', self.batches, self.BATCH_BUCKETS)
+            lines.append(f"# TYPE {prefix}_events_total counter")
+            lines += [f'{prefix}_events_total{{event="{name}"}} {count}' for name, count in sorted(self.counters.items())]
+        return '\n'.join(lines) + '\n'
+
+    def dump_prometheus(self, path):
+        """Atomically write the Prometheus text file (e.g. for node_exporter's textfile collector)"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def start_periodic_dump(self, interval_s=60, path=None):
+        """Every interval_s seconds, write the Prometheus file to path, or log a summary when path is None"""
+        def tick():
+            try:
+                if path:
+                    self.dump_prometheus(path)
+                else:
+                    self.log_summary()
+            finally:
+                if self._dump_timer is not None:
+                    self.start_periodic_dump(interval_s, path)
+        self._dump_timer = threading.Timer(interval_s, tick)
+        self._dump_timer.daemon = True
+        self._dump_timer.start()
+
+    def stop_periodic_dump(self):
+        timer, self._dump_timer = self._dump_timer, None
+        if timer is not None:
+            timer.cancel()
+
+
+# Set EMOTION_PIPELINE_METRICS=1 (or call pipeline_metrics.enable()) to collect metrics
+pipeline_metrics = PipelineMetrics(enabled=os.environ.get('EMOTION_PIPELINE_METRICS') == '1')
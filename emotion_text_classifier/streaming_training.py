@@ -0,0 +1,204 @@
+"""Out-of-core training: chunked CSV -> preprocessing -> HashingVectorizer -> SGDClassifier.partial_fit"""
+import os
+import copy
+import glob
+import time
+import zlib
+import argparse
+import tempfile
+from collections import Counter
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import classification_report
+from sklearn.pipeline import Pipeline
+from text_preprocessing import LemmaTable, preprocess_text, parallel_preprocess_texts
+from emotion_predictor import EmotionPredictor, save_model
+
+REQUIRED_COLUMNS = ['text', 'emotion']
+
+
+def held_out_mask(texts, test_size):
+    """Stable train/test split from a CRC32 of each raw text: the same rows are held out on every pass"""
+    threshold = int(test_size * (1 << 32))
+    return np.fromiter((zlib.crc32(text.encode('utf-8')) < threshold for text in texts), dtype=bool, count=len(texts))
+
+
+def spill_preprocessed_chunks(csv_path, spill_dir, vectorizer, lemma_table, chunk_size=50000, test_size=0.2,
+                              n_workers=1):
+    """Validate and preprocess the CSV chunk by chunk, writing train/test chunks to spill_dir as pickles.
+    Label counts, the training document frequencies for the IDF and lemma_table are accumulated on the way."""
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        raise ValueError(f"Data file missing required columns: {missing_columns}")
+
+    label_counts = Counter()
+    document_frequency = np.zeros(vectorizer.n_features, dtype=np.int64)
+    stats = {'rows': 0, 'dropped': 0, 'train_rows': 0, 'test_rows': 0}
+    start_time = time.time()
+    reader = pd.read_csv(csv_path, usecols=REQUIRED_COLUMNS, chunksize=chunk_size)
+    for chunk_index, chunk in enumerate(reader):
+        n_read = len(chunk)
+        chunk = chunk.dropna(subset=REQUIRED_COLUMNS)
+        stats['rows'] += n_read
+        stats['dropped'] += n_read - len(chunk)
+        texts = chunk['text'].astype(str).tolist()
+        # New tokens are lemmatized here, before any fork, so workers only do table lookups
+        lemma_table.update(texts)
+        if n_workers > 1:
+            processed = parallel_preprocess_texts(texts, n_workers, max(len(texts) // n_workers, 1), lemma_table)
+        else:
+            processed = [preprocess_text(text, lemma_table=lemma_table) for text in texts]
+
+        spilled = pd.DataFrame({'processed_text': processed, 'emotion': chunk['emotion'].astype(str).values})
+        test_mask = held_out_mask(texts, test_size)
+        train, test = spilled[~test_mask], spilled[test_mask]
+        label_counts.update(train['emotion'])
+        counts = vectorizer.transform(train['processed_text'])
+        document_frequency += np.bincount(counts.indices, minlength=vectorizer.n_features)
+        train.reset_index(drop=True).to_pickle(os.path.join(spill_dir, f'train_{chunk_index:06d}.pkl'))
+        test.reset_index(drop=True).to_pickle(os.path.join(spill_dir, f'test_{chunk_index:06d}.pkl'))
+        stats['train_rows'] += len(train)
+        stats['test_rows'] += len(test)
+        print(f"  Chunk {chunk_index + 1}: {stats['rows']} rows read, {stats['train_rows']} train / "
+              f"{stats['test_rows']} held out ({stats['rows'] / max(time.time() - start_time, 1e-9):.0f} rows/sec)")
+
+    if stats['dropped']:
+        print(f"Warning: removed {stats['dropped']} rows with null values")
+    if not stats['train_rows']:
+        raise ValueError(f"No training rows in {csv_path}")
+    return label_counts, document_frequency, stats
+
+
+def build_feature_transformer(n_features, document_frequency, n_documents, use_idf=True):
+    """TfidfTransformer whose IDF comes from the streamed document frequencies instead of a fit on the corpus"""
+    transformer = TfidfTransformer(use_idf=use_idf, smooth_idf=True, sublinear_tf=True, norm='l2')
+    transformer.fit(sparse.csr_matrix((1, n_features)))
+    if use_idf:
+        transformer.idf_ = np.log((1 + n_documents) / (1 + document_frequency)) + 1
+    return transformer
+
+
+def iter_spilled_chunks(spill_dir, split, rng=None):
+    """Yield the spilled chunks of one split, in shuffled order with shuffled rows when rng is given"""
+    paths = sorted(glob.glob(os.path.join(spill_dir, f'{split}_*.pkl')))
+    if rng is not None:
+        paths = [paths[i] for i in rng.permutation(len(paths))]
+    for path in paths:
+        chunk = pd.read_pickle(path)
+        if rng is not None:
+            chunk = chunk.iloc[rng.permutation(len(chunk))]
+        if len(chunk):
+            yield chunk
+
+
+def evaluate_stream(featurize, classifier, spill_dir, emotion_mapping):
+    """Accumulate a confusion matrix over the held-out chunks"""
+    n_classes = len(emotion_mapping)
+    confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+    for chunk in iter_spilled_chunks(spill_dir, 'test'):
+        y_true = chunk['emotion'].map(emotion_mapping)
+        y_pred = classifier.predict(featurize(chunk['processed_text']))
+        # Labels missing from the training split cannot be predicted; they stay out of the matrix and count as errors
+        known = y_true.notnull().values
+        np.add.at(confusion, (y_true[known].astype(int).values, y_pred[known]), 1)
+    return confusion
+
+
+def report_from_confusion(confusion, emotion_mapping):
+    """classification_report for a confusion matrix, expanded back into (true, predicted) label id pairs"""
+    emotions = sorted(emotion_mapping, key=emotion_mapping.get)
+    true_ids, pred_ids = np.nonzero(confusion)
+    counts = confusion[true_ids, pred_ids]
+    return classification_report(
+        np.repeat(true_ids, counts), np.repeat(pred_ids, counts),
+        labels=np.arange(len(emotions)), target_names=emotions, zero_division=0
+    )
+
+
+def train_streaming(csv_path, spill_dir, lemma_table, chunk_size=50000, test_size=0.2, epochs=5, patience=2,
+                    n_features=1 << 20, ngram_range=(1, 2), use_idf=True, alpha=1e-6, n_workers=1, seed=42):
+    """Train a HashingVectorizer + TF-IDF + SGD logistic regression pipeline without holding the corpus in memory"""
+    # alternate_sign=False and no norm: raw counts, so sublinear TF, IDF and l2 norm match TfidfVectorizer's order
+    vectorizer = HashingVectorizer(n_features=n_features, ngram_range=ngram_range, alternate_sign=False, norm=None)
+
+    print(f"Pass 1: preprocessing {csv_path} in chunks of {chunk_size} rows...")
+    start_time = time.time()
+    label_counts, document_frequency, stats = spill_preprocessed_chunks(
+        csv_path, spill_dir, vectorizer, lemma_table, chunk_size, test_size, n_workers)
+    print(f"Preprocessed {stats['rows']} rows in {time.time() - start_time:.2f} seconds")
+
+    emotion_mapping = {emotion: i for i, emotion in enumerate(sorted(label_counts))}
+    classes = np.arange(len(emotion_mapping))
+    # partial_fit does not accept class_weight='balanced', so the balanced weights are computed from the counts
+    class_weight = {emotion_mapping[emotion]: stats['train_rows'] / (len(label_counts) * count)
+                    for emotion, count in label_counts.items()}
+    transformer = build_feature_transformer(n_features, document_frequency, stats['train_rows'], use_idf)
+
+    def featurize(texts):
+        return transformer.transform(vectorizer.transform(texts))
+
+    classifier = SGDClassifier(loss='log_loss', alpha=alpha, class_weight=class_weight, random_state=seed)
+    rng = np.random.default_rng(seed)
+    best = {'accuracy': -1.0, 'epoch': 0, 'classifier': None, 'confusion': None}
+    for epoch in range(1, epochs + 1):
+        start_time = time.time()
+        for chunk in iter_spilled_chunks(spill_dir, 'train', rng):
+            classifier.partial_fit(featurize(chunk['processed_text']), chunk['emotion'].map(emotion_mapping).values,
+                                   classes=classes)
+        confusion = evaluate_stream(featurize, classifier, spill_dir, emotion_mapping)
+        accuracy = np.trace(confusion) / max(stats['test_rows'], 1)
+        print(f"Epoch {epoch}/{epochs}: held-out accuracy {accuracy:.4f} ({time.time() - start_time:.2f} seconds)")
+        if accuracy > best['accuracy']:
+            best = {'accuracy': accuracy, 'epoch': epoch, 'classifier': copy.deepcopy(classifier),
+                    'confusion': confusion}
+        elif epoch - best['epoch'] >= patience:
+            print(f"No improvement for {patience} epochs, stopping")
+            break
+
+    model = Pipeline([('vectorizer', vectorizer), ('tfidf', transformer), ('classifier', best['classifier'])])
+    report = report_from_confusion(best['confusion'], emotion_mapping)
+    print(f"Best epoch {best['epoch']}: held-out accuracy {best['accuracy']:.4f}")
+    print("\nClassification Report:")
+    print(report)
+    return model, emotion_mapping, report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the emotion classifier out of core on a large CSV")
+    parser.add_argument('data', help="CSV with 'text' and 'emotion' columns")
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--spill-dir', help="where preprocessed chunks are kept (default: a temporary directory)")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--patience', type=int, default=2)
+    parser.add_argument('--n-features', type=int, default=1 << 20)
+    parser.add_argument('--ngram-max', type=int, default=2)
+    parser.add_argument('--no-idf', action='store_true', help="skip the streamed IDF weighting")
+    parser.add_argument('--alpha', type=float, default=1e-6)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    # Grows chunk by chunk to cover the corpus vocabulary and is saved with the model
+    lemma_table = LemmaTable.build([])
+
+    with tempfile.TemporaryDirectory(dir=args.spill_dir) as spill_dir:
+        model, emotion_mapping, report = train_streaming(
+            args.data, spill_dir, lemma_table, chunk_size=args.chunk_size, test_size=args.test_size,
+            epochs=args.epochs, patience=args.patience, n_features=args.n_features,
+            ngram_range=(1, args.ngram_max), use_idf=not args.no_idf, alpha=args.alpha, n_workers=args.workers
+        )
+
+    save_model(
+        model, emotion_mapping,
+        os.path.join(args.output_dir, 'emotion_model.pkl'), os.path.join(args.output_dir, 'emotion_mapping.pkl'),
+        report, os.path.join(args.output_dir, 'classification_report.txt'),
+        lemma_table=lemma_table
+    )
+    predictor = EmotionPredictor(model, emotion_mapping, lemma_table=lemma_table)
+    result = predictor.predict("I feel wonderful and loved today")
+    print(f"Sanity check: {result['emotion']} ({result['confidence']:.3f})")
@@ -0,0 +1,22 @@
+from benchmark_suite import compare_to_baseline
+
+
+def case(throughput, p99, memory=1.0):
+    return {'items': 100, 'throughput_per_s': throughput, 'p50_ms': p99 / 2, 'p99_ms': p99, 'peak_memory_mb': memory}
+
+
+def test_compare_to_baseline_flags_slowdowns_only_past_thresholds():
+    baseline = {'cases': {'fast': case(1000, 2.0), 'slow': case(1000, 2.0)}}
+    results = {'cases': {'fast': case(950, 2.1), 'slow': case(500, 4.0)}}
+    rows, regressions = compare_to_baseline(results, baseline)
+    assert len(rows) == 6
+    assert {(row['case'], row['metric']) for row in regressions} == {('slow', 'throughput_per_s'), ('slow', 'p99_ms')}
+
+
+def test_case_failing_now_is_a_regression():
+    baseline = {'cases': {'predict': case(1000, 2.0), 'broken': {'error': 'LookupError: stopwords'}}}
+    results = {'cases': {'predict': {'error': 'LookupError: stopwords'}, 'broken': {'error': 'LookupError: stopwords'},
+                         'new_case': case(1000, 2.0)}}
+    rows, regressions = compare_to_baseline(results, baseline)
+    assert [(row['case'], row['metric']) for row in regressions] == [('predict', 'error')]
+    assert regressions[0]['current'] == 'LookupError: stopwords'
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+from emotion_inference_engine import (export_compact_model, load_compact_model, verify_compact_model,
+                                      NumpyEmotionPredictor)
+from emotion_predictor import EmotionPredictor
+from text_preprocessing import LemmaTable, PreprocessingCache, clean_text, fast_tokenize
+
+TEXTS = [
+    "i feel so happy and loved today",
+    "i am really angry about the long wait",
+    "this makes me feel sad and alone again",
+    "i was scared walking home alone at night",
+    "what a wonderful surprise from my friends",
+    "i feel happy happy happy about the trip",
+    "the wait made me angry and tired and sad",
+    "i am scared of the dark and the noise",
+]
+LABELS = [0, 1, 2, 3, 0, 0, 1, 3]
+EMOTION_MAPPING = {'joy': 0, 'anger': 1, 'sadness': 2, 'fear': 3}
+
+
+def fit_pipeline(ngram_range):
+    pipeline = Pipeline([
+        ('tfidf', TfidfVectorizer(ngram_range=ngram_range, sublinear_tf=True)),
+        ('classifier', LogisticRegression(C=10, max_iter=1000))
+    ])
+    return pipeline.fit(TEXTS, LABELS)
+
+
+@pytest.mark.parametrize('ngram_range', [(1, 1), (1, 2), (1, 3), (1, 4), (2, 3), (3, 4)])
+def test_round_trip_matches_pipeline(tmp_path, ngram_range):
+    pipeline = fit_pipeline(ngram_range)
+    export_compact_model(pipeline, EMOTION_MAPPING, str(tmp_path))
+    probe = TEXTS + ["happy happy happy happy", "angry and sad and scared and alone", "a", ""]
+    assert verify_compact_model(pipeline, str(tmp_path), probe) <= 1e-5
+
+
+@pytest.mark.parametrize('ngram_range', [(1, 3), (1, 4)])
+def test_ngrams_match_vectorizer_analyzer(tmp_path, ngram_range):
+    pipeline = fit_pipeline(ngram_range)
+    export_compact_model(pipeline, EMOTION_MAPPING, str(tmp_path))
+    compact_model = load_compact_model(str(tmp_path))
+    analyzer = pipeline.named_steps['tfidf'].build_analyzer()
+    for text in TEXTS:
+        assert compact_model._ngrams(text) == analyzer(text)
+
+
+def test_two_class_round_trip(tmp_path):
+    pipeline = Pipeline([
+        ('tfidf', TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True)),
+        ('classifier', LogisticRegression(C=10, max_iter=1000))
+    ]).fit(TEXTS, [int(label == 0) for label in LABELS])
+    export_compact_model(pipeline, {'other': 0, 'joy': 1}, str(tmp_path))
+    compact_model = load_compact_model(str(tmp_path))
+    assert compact_model.multi_class == 'ovr'
+    assert verify_compact_model(pipeline, str(tmp_path), TEXTS + ["happy happy", ""]) <= 1e-5
+
+    # A two-class multinomial model (explicit multi_class='multinomial' in older sklearn) is softmax([-d, d])
+    compact_model.multi_class = 'multinomial'
+    decision = compact_model.decision_function(TEXTS)[:, 0]
+    expected = np.exp(np.column_stack([-decision, decision]))
+    expected /= expected.sum(axis=1, keepdims=True)
+    np.testing.assert_allclose(compact_model.predict_proba(TEXTS), expected, atol=1e-6)
+
+
+def identity_lemma_table(texts):
+    # Every token maps to itself, so no NLTK corpus is needed
+    return LemmaTable({token: token for text in texts for token in fast_tokenize(clean_text(text))})
+
+
+def test_numpy_predictor_matches_pipeline(tmp_path):
+    pipeline = fit_pipeline((1, 4))
+    export_compact_model(pipeline, EMOTION_MAPPING, str(tmp_path))
+    lemma_table = identity_lemma_table(TEXTS)
+    expected_predictor = EmotionPredictor(pipeline, EMOTION_MAPPING, PreprocessingCache(), lemma_table)
+    predictor = NumpyEmotionPredictor.from_directory(str(tmp_path), cache=PreprocessingCache(),
+                                                     lemma_table=lemma_table)
+    texts = TEXTS + ["", "   ", "\t\n"]
+
+    for text in texts:
+        result, expected = predictor.predict(text), expected_predictor.predict(text)
+        assert result['emotion'] == expected['emotion']
+        assert result['processed_text'] == expected['processed_text']
+        np.testing.assert_allclose(result['confidence'], expected['confidence'], atol=1e-5)
+
+    results, expected = predictor.predict_batch(texts), expected_predictor.predict_batch(texts)
+    assert [r['text'] for r in results] == [r['text'] for r in expected] == TEXTS + ["   ", "\t\n"]
+    assert [r['emotion'] for r in results] == [r['emotion'] for r in expected]
+
+    columns = predictor.predict_batch(texts, columnar=True)
+    expected_columns = expected_predictor.predict_batch(texts, columnar=True)
+    np.testing.assert_allclose(columns['probabilities'], expected_columns['probabilities'], atol=1e-5)
+    assert columns['emotion_labels'] == expected_columns['emotion_labels']
+    assert predictor.predict_batch(["", ""]) == expected_predictor.predict_batch(["", ""]) == []
+
+    aligned = predictor.predict_batch(texts, keep_empty=True)
+    assert [r['text'] for r in aligned] == texts
+    assert aligned[len(TEXTS)]['emotion'] == predictor.predict("")['emotion']
@@ -0,0 +1,220 @@
+import csv
+import os
+import random
+
+import pytest
+
+from diary_storage import FTS_TOKENIZE, migrate_csv_diary, open_diary_store, verify_rollups
+
+EMOTIONS = ['anger', 'fear', 'joy', 'love', 'sadness', 'surprise']
+# Neighbouring dates that cross day, Monday-based week, month and year buckets, some written non-canonically
+DATES = ['2023-12-31 23:59:59', '2024-1-1', '2024-01-07 12:00:00', '2024-01-08 00:00:00', '2024-01-31 23:59:59',
+         '2024-02-01 00:00', '2024-02-04 18:30:00', '2024-2-5 8:05:00', '2024-02-29 10:00:00']
+EXTENSIONS = ['.db', '.jsonl', '.csv']
+
+
+def random_entry(rng):
+    return {'text': f"entry about my day number {rng.randrange(1000)}", 'emotion': rng.choice(EMOTIONS),
+            'date': rng.choice(DATES)}
+
+
+def random_update(rng):
+    fields = {}
+    while not fields:
+        if rng.random() < 0.5:
+            fields['date'] = rng.choice(DATES)
+        if rng.random() < 0.5:
+            fields['emotion'] = rng.choice(EMOTIONS)
+        if rng.random() < 0.3:
+            fields['text'] = f"edited entry {rng.randrange(1000)}"
+    return fields
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_incremental_rollups_match_full_recomputation(tmp_path, extension, seed):
+    rng = random.Random(seed)
+    path = str(tmp_path / f'diary{extension}')
+    store = open_diary_store(path)
+    ids = store.add_many([random_entry(rng) for _ in range(20)])
+    for step in range(120):
+        action = rng.random()
+        if action < 0.35 or not ids:
+            ids.append(store.add(random_entry(rng)))
+        elif action < 0.75:
+            store.update(rng.choice(ids), random_update(rng))
+        elif action < 0.9:
+            entry_id = ids.pop(rng.randrange(len(ids)))
+            store.delete(entry_id)
+        elif extension != '.csv':
+            # Relabelling from a re-score changes an entry's emotion outside update()
+            entries = [store.get(entry_id) for entry_id in rng.sample(ids, min(3, len(ids)))]
+            store.save_scores([{'id': entry['id'], 'text': entry['text'], 'model_version': f'v{step}',
+                                'emotion': rng.choice(EMOTIONS), 'probabilities': {}} for entry in entries],
+                              relabel=True)
+        if step % 40 == 39:
+            assert verify_rollups(store) == {}
+            store.close()
+            store = open_diary_store(path)
+    assert verify_rollups(store) == {}
+    store.close()
+
+
+def apply_operations(store):
+    ids = store.add_many([{'text': f"first batch entry {i}", 'emotion': EMOTIONS[i % 6], 'date': DATES[i % 9]}
+                          for i in range(12)])
+    ids.append(store.add({'text': "a single entry", 'emotion': 'joy', 'date': '2024-2-5'}))
+    store.update(ids[0], {'text': "edited text", 'date': '2024-02-29 10:00:00'})
+    store.update(ids[1], {'emotion': 'love', 'unknown_field': 'ignored'})
+    store.delete(ids[2])
+    store.delete(ids[5])
+    return ids
+
+
+@pytest.mark.parametrize('extension', ['.jsonl', '.csv'])
+def test_backends_agree_with_sqlite(tmp_path, extension):
+    reference = open_diary_store(str(tmp_path / 'diary.db'))
+    store = open_diary_store(str(tmp_path / f'diary{extension}'))
+    assert apply_operations(store) == apply_operations(reference)
+
+    # The legacy CSV has no id column and renumbers entries when reopened, so only the journal is reopened
+    reopened = [open_diary_store(str(tmp_path / f'diary{extension}'))] if extension == '.jsonl' else []
+    for current in [store] + reopened:
+        assert current.all_entries() == reference.all_entries()
+        assert current.count() == reference.count() == 11
+        assert current.get(1) == reference.get(1) == {'id': 1, 'text': "edited text", 'emotion': 'anger',
+                                                        'date': '2024-02-29 10:00:00'}
+        assert current.get(3) is None
+        assert current.page_before(None, 4) == reference.page_before(None, 4)
+        assert current.page_before(8, 4) == reference.page_before(8, 4)
+        assert list(current.iter_entries(page_size=3)) == list(reference.iter_entries(page_size=3))
+        current.close()
+    reference.close()
+
+
+def test_journal_reopens_after_a_torn_last_record(tmp_path):
+    path = str(tmp_path / 'diary.jsonl')
+    store = open_diary_store(path)
+    store.add_many([{'text': f"entry {i}", 'emotion': 'joy', 'date': '2024-01-05 10:00:00'} for i in range(3)])
+    store.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "add", "id": 4, "text": "half writ')
+
+    store = open_diary_store(path)
+    assert [entry['id'] for entry in store.all_entries()] == [1, 2, 3]
+    new_id = store.add({'text': "written after the crash", 'emotion': 'fear', 'date': '2024-01-06 10:00:00'})
+    store.close()
+
+    store = open_diary_store(path)
+    assert store.get(new_id)['text'] == "written after the crash"
+    assert store.count() == 4
+    assert verify_rollups(store) == {}
+    store.close()
+
+
+def test_journal_replay_after_compaction(tmp_path):
+    path = str(tmp_path / 'diary.jsonl')
+    store = open_diary_store(path)
+    store.compact_min_ops = 10
+    entry_id = store.add({'text': "kept", 'emotion': 'joy', 'date': '2024-01-05'})
+    for i in range(30):
+        store.update(entry_id, {'text': f"kept {i}"})
+    store.close()
+    with open(path, encoding='utf-8') as f:
+        assert len(f.readlines()) < 30
+
+    store = open_diary_store(path)
+    assert store.all_entries() == [{'id': entry_id, 'text': "kept 29", 'emotion': 'joy',
+                                    'date': '2024-01-05 00:00:00'}]
+    store.close()
+
+
+def test_migrate_legacy_csv_into_sqlite(tmp_path, capsys):
+    csv_path = str(tmp_path / 'emotion_diary.csv')
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['text', 'emotion', 'date'])
+        writer.writerow(["a good day", 'joy', '2024-1-5 9:00:00'])
+        writer.writerow(["an impossible day", 'sadness', '2024-02-30 10:00:00'])
+        writer.writerow(["no date at all", 'fear', ''])
+
+    store = open_diary_store(str(tmp_path / 'diary.db'))
+    assert migrate_csv_diary(csv_path, store) == 3
+    assert not os.path.exists(csv_path) and os.path.exists(csv_path + '.migrated')
+    assert "1 entries" in capsys.readouterr().out
+
+    entries = store.all_entries()
+    assert [entry['text'] for entry in entries] == ["a good day", "an impossible day", "no date at all"]
+    assert entries[0]['date'] == '2024-01-05 09:00:00'
+    # Invalid and missing dates get the migration time, in the canonical format
+    assert entries[1]['date'] == entries[2]['date'] and len(entries[1]['date']) == 19
+    assert verify_rollups(store) == {}
+
+    # A second run is a no-op: the CSV is gone and the store is no longer empty
+    assert migrate_csv_diary(csv_path, store) == 0
+    assert store.count() == 3
+    store.close()
+
+
+SEARCH_ENTRIES = [
+    {'text': "Coffee at the café with my_tag", 'emotion': 'joy', 'date': '2024-01-05 10:00:00'},
+    {'text': "cafe and my tag", 'emotion': 'fear', 'date': '2024-01-06 10:00:00'},
+    {'text': "CAFÉ again, happy", 'emotion': 'joy', 'date': '2024-01-31 23:59:59'},
+    {'text': "a quiet day", 'emotion': 'sadness', 'date': '2024-02-01 00:00:00'},
+    {'text': "happy my_tag day", 'emotion': 'joy', 'date': '2024-02-05 08:00:00'},
+]
+SEARCHES = [
+    {'keyword': 'café'}, {'keyword': 'cafe'}, {'keyword': 'CAFÉ'}, {'keyword': 'my_tag'}, {'keyword': 'tag'},
+    {'keyword': 'my tag'}, {'keyword': 'happy day'}, {'keyword': 'missing'},
+    {'emotion': 'joy'}, {'emotion': 'joy', 'date_from': '2024-01-06', 'date_to': '2024-01-31'},
+    {'date_from': '2024-02-01'}, {'date_to': '2024-01-06'}, {'date_from': '2024-01-06 10:00:00'},
+    {'emotion': 'joy', 'keyword': 'happy', 'date_from': '2024-02-01'}, {'keyword': 'café', 'before_id': 3},
+]
+
+
+@pytest.fixture
+def search_stores(tmp_path):
+    stores = {}
+    for extension in EXTENSIONS:
+        stores[extension] = open_diary_store(str(tmp_path / f'diary{extension}'))
+        stores[extension].add_many(SEARCH_ENTRIES)
+    yield stores
+    for store in stores.values():
+        store.close()
+
+
+@pytest.mark.parametrize('search', SEARCHES, ids=repr)
+def test_search_parity_across_backends(search_stores, search):
+    # The CSV store scans every entry with entry_matches, so it is the reference for the indexed backends
+    expected = [entry['id'] for entry in search_stores['.csv'].search(**search)]
+    for extension in ('.db', '.jsonl'):
+        assert [entry['id'] for entry in search_stores[extension].search(**search)] == expected
+
+
+def test_keyword_search_keeps_diacritics_and_underscores(search_stores):
+    for store in search_stores.values():
+        assert [entry['id'] for entry in store.search(keyword='café')] == [3, 1]
+        assert [entry['id'] for entry in store.search(keyword='cafe')] == [2]
+        assert [entry['id'] for entry in store.search(keyword='my_tag')] == [5, 1]
+
+
+def test_old_fts_index_is_rebuilt_with_the_aligned_tokenizer(tmp_path):
+    path = str(tmp_path / 'diary.db')
+    store = open_diary_store(path)
+    store.add_many(SEARCH_ENTRIES)
+    # Recreate the index the way diaries created before the tokenizer fix have it
+    with store.conn:
+        store.conn.execute("DROP TABLE entries_fts")
+        store.conn.execute("CREATE VIRTUAL TABLE entries_fts USING fts5(text, content='entries', content_rowid='id')")
+        store.conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+    assert [entry['id'] for entry in store.search(keyword='cafe')] == [3, 2, 1]
+    store.close()
+
+    store = open_diary_store(path)
+    sql = store.conn.execute("SELECT sql FROM sqlite_master WHERE name = 'entries_fts'").fetchone()[0]
+    assert FTS_TOKENIZE in sql
+    assert [entry['id'] for entry in store.search(keyword='cafe')] == [2]
+    assert [entry['id'] for entry in store.search(keyword='my_tag')] == [5, 1]
+    new_id = store.add({'text': "one more café", 'emotion': 'love', 'date': '2024-03-01'})
+    assert [entry['id'] for entry in store.search(keyword='café')] == [new_id, 3, 1]
+    store.close()
@@ -0,0 +1,64 @@
+import pytest
+
+from pipeline_metrics import PipelineMetrics, pipeline_metrics
+from text_preprocessing import (LemmaTable, PreprocessingCache, clean_text, fast_tokenize, parallel_preprocess_texts,
+                                preprocess_text)
+
+TEXTS = [f"I felt number {i} and the word{i % 7} again" for i in range(300)]
+
+
+@pytest.fixture
+def metrics_enabled():
+    pipeline_metrics.reset()
+    pipeline_metrics.enable()
+    yield pipeline_metrics
+    pipeline_metrics.disable()
+    pipeline_metrics.reset()
+
+
+def identity_lemma_table(texts):
+    # Every token is covered, so no NLTK corpus is needed
+    table = LemmaTable({'the': LemmaTable.DROP, 'and': LemmaTable.DROP, 'i': LemmaTable.DROP})
+    for text in texts:
+        for token in fast_tokenize(clean_text(text)):
+            table.table.setdefault(token, token)
+    return table
+
+
+def test_merge_adds_drained_histograms_and_counters():
+    worker, parent = PipelineMetrics(enabled=True), PipelineMetrics(enabled=True)
+    for metrics in (worker, parent):
+        metrics.observe('stage', 0.002)
+        metrics.observe_batch('batch', 10)
+        metrics.increment('event', 2)
+    worker.observe('worker_only', 0.5)
+
+    parent.merge(worker.drain())
+    snapshot = parent.snapshot()
+    assert snapshot['stages']['stage']['count'] == 2
+    assert snapshot['stages']['worker_only']['count'] == 1
+    assert snapshot['batches']['batch']['items'] == 20
+    assert snapshot['counters'] == {'event': 4}
+    assert worker.snapshot()['stages'] == {}
+
+
+def test_parallel_preprocessing_reports_worker_metrics(metrics_enabled):
+    lemma_table = identity_lemma_table(TEXTS)
+    metrics_enabled.increment('before_fork')
+    processed = parallel_preprocess_texts(TEXTS, n_workers=2, shard_size=50, lemma_table=lemma_table)
+
+    metrics_enabled.disable()
+    assert processed == [preprocess_text(text, PreprocessingCache(0), lemma_table) for text in TEXTS]
+    metrics_enabled.enable()
+    snapshot = metrics_enabled.snapshot()
+    assert snapshot['counters']['before_fork'] == 1
+    assert snapshot['counters']['preprocess_text.cache_misses'] == len(TEXTS)
+    assert snapshot['stages']['preprocess_text']['count'] == len(TEXTS)
+
+
+def test_parallel_preprocessing_fills_the_given_cache():
+    lemma_table = identity_lemma_table(TEXTS)
+    cache = PreprocessingCache(max_size=100)
+    processed = parallel_preprocess_texts(TEXTS, n_workers=2, shard_size=50, lemma_table=lemma_table, cache=cache)
+    assert len(cache) == 100
+    assert cache.get(TEXTS[-1]) == processed[-1]
@@ -0,0 +1,106 @@
+import random
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+
+from streaming_training import (build_feature_transformer, evaluate_stream, held_out_mask, iter_spilled_chunks,
+                                spill_preprocessed_chunks, train_streaming)
+from text_preprocessing import LemmaTable, clean_text, fast_tokenize
+
+N_FEATURES = 1 << 12
+TEST_SIZE = 0.25
+EMOTION_WORDS = {
+    'anger': ['furious', 'rage', 'annoyed', 'shouting'],
+    'joy': ['happy', 'smiling', 'delighted', 'sunshine'],
+    'sadness': ['crying', 'lonely', 'gloomy', 'tears'],
+}
+FILLER = ['today', 'morning', 'work', 'friend', 'walk', 'dinner', 'weekend', 'home']
+
+
+def write_corpus(path, n_rows=240, seed=0, held_out_label=None):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_rows):
+        emotion = rng.choice(sorted(EMOTION_WORDS))
+        words = rng.sample(EMOTION_WORDS[emotion], 2) + rng.sample(FILLER, 3) + [f'n{i}']
+        rng.shuffle(words)
+        rows.append({'text': ' '.join(words), 'emotion': emotion})
+    if held_out_label is not None:
+        # Relabel some rows that the CRC32 split will always hold out, so the label never reaches training
+        mask = held_out_mask([row['text'] for row in rows], TEST_SIZE)
+        for index in np.flatnonzero(mask)[:5]:
+            rows[index]['emotion'] = held_out_label
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return rows
+
+
+def identity_lemma_table(texts):
+    # Every token maps to itself, so no NLTK corpus is needed
+    return LemmaTable({token: token for text in texts for token in fast_tokenize(clean_text(text))})
+
+
+def spill(csv_path, spill_dir, lemma_table, chunk_size):
+    vectorizer = HashingVectorizer(n_features=N_FEATURES, ngram_range=(1, 2), alternate_sign=False, norm=None)
+    spill_dir.mkdir()
+    label_counts, document_frequency, stats = spill_preprocessed_chunks(
+        str(csv_path), str(spill_dir), vectorizer, lemma_table, chunk_size, TEST_SIZE)
+    return vectorizer, document_frequency, stats
+
+
+def read_split(spill_dir, split):
+    return pd.concat(list(iter_spilled_chunks(str(spill_dir), split)), ignore_index=True)
+
+
+def test_held_out_mask_is_stable_across_passes(tmp_path):
+    rows = write_corpus(tmp_path / 'corpus.csv')
+    texts = [row['text'] for row in rows]
+    mask = held_out_mask(texts, TEST_SIZE)
+    assert np.array_equal(mask, held_out_mask(texts, TEST_SIZE))
+    assert np.array_equal(mask, np.concatenate([held_out_mask(texts[:100], TEST_SIZE),
+                                                held_out_mask(texts[100:], TEST_SIZE)]))
+    assert 0 < mask.sum() < len(texts)
+
+    # Different chunk sizes hold out the same rows, in the same order
+    lemma_table = identity_lemma_table(texts)
+    spill(tmp_path / 'corpus.csv', tmp_path / 'spill_a', lemma_table, chunk_size=50)
+    spill(tmp_path / 'corpus.csv', tmp_path / 'spill_b', lemma_table, chunk_size=240)
+    for split in ('train', 'test'):
+        pd.testing.assert_frame_equal(read_split(tmp_path / 'spill_a', split), read_split(tmp_path / 'spill_b', split))
+    assert len(read_split(tmp_path / 'spill_a', 'test')) == mask.sum()
+
+
+def test_streamed_idf_matches_tfidf_transformer(tmp_path):
+    rows = write_corpus(tmp_path / 'corpus.csv')
+    lemma_table = identity_lemma_table([row['text'] for row in rows])
+    vectorizer, document_frequency, stats = spill(tmp_path / 'corpus.csv', tmp_path / 'spill', lemma_table,
+                                                  chunk_size=70)
+
+    train = read_split(tmp_path / 'spill', 'train')
+    assert len(train) == stats['train_rows']
+    counts = vectorizer.transform(train['processed_text'])
+    expected = TfidfTransformer(smooth_idf=True, sublinear_tf=True).fit(counts)
+    transformer = build_feature_transformer(N_FEATURES, document_frequency, stats['train_rows'])
+    np.testing.assert_allclose(transformer.idf_, expected.idf_)
+    np.testing.assert_allclose(transformer.transform(counts).toarray(), expected.transform(counts).toarray())
+
+
+def test_labels_only_in_held_out_split_count_as_errors(tmp_path):
+    rows = write_corpus(tmp_path / 'corpus.csv', held_out_label='surprise')
+    lemma_table = identity_lemma_table([row['text'] for row in rows])
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    model, emotion_mapping, report = train_streaming(str(tmp_path / 'corpus.csv'), str(spill_dir), lemma_table,
+                                                     chunk_size=70, test_size=TEST_SIZE, epochs=2,
+                                                     n_features=N_FEATURES)
+    assert sorted(emotion_mapping) == sorted(EMOTION_WORDS)
+    assert 'surprise' not in report
+
+    test = read_split(spill_dir, 'test')
+    n_unknown = (test['emotion'] == 'surprise').sum()
+    assert n_unknown == 5
+    confusion = evaluate_stream(model[:-1].transform, model.named_steps['classifier'], str(spill_dir),
+                                emotion_mapping)
+    assert confusion.sum() == len(test) - n_unknown
+    # train_streaming divides by every held-out row, so the unknown label lowers the accuracy
+    assert np.trace(confusion) / len(test) <= 1 - n_unknown / len(test)
@@ -0,0 +1,91 @@
+import csv
+import os
+import random
+import re
+
+import pytest
+
+from text_preprocessing import TREEBANK_SPLITS, clean_text, clean_texts, fast_tokenize
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prediction_results.csv')
+# (raw text, expected clean_text output); the edge cases where a single-pass cleaner is easiest to get wrong
+CLEAN_TEXT_GOLDEN = [
+    ("I'm SO happy!!! :) <3 2day", 'i m so happy day'),
+    ('<b>bold</b> and <i>it</i>', 'bold and it'),
+    ('see https://example.com/a?b=<1> now', 'see now'),
+    ('www.site.org/page, then more', 'then more'),
+    ("<a href='https://x.com/>'>link</a> text", 'a href text'),
+    ('<a www.x> y>', ''),
+    ('<a http://x>y', 'a'),
+    ('xhttp://y z', 'x z'),
+    ('http:// x', 'http x'),
+    ('<<a>>', ''),
+    ('<a\nb>c', 'a b c'),
+    ('tab\there\r\nnew line', 'tab here new line'),
+    ('foo_bar 12abc 3_4 \u0664\u0665', 'foo_bar abc _'),
+    ('\u00c9COLE \u0130stanbul Stra\u00dfe', '\u00e9cole i stanbul stra\u00dfe'),
+    ('emoji \U0001f60a \u263a\ufe0f only', 'emoji only'),
+    ('', ''),
+    ('   ', ''),
+    (None, 'none'),
+    (3.5, ''),
+    (float('nan'), 'nan'),
+]
+TOKENIZER_CASES = [
+    "i cannot believe it", "gimme that gonna be fun", "we gotta go lemme see", "i wanna cry", "wanna",
+    "cannotx xcannot", "CANNOT gonna", "more n d ye tis twas", "don t won t can t", "", "a",
+]
+
+
+def clean_text_chained(text):
+    """The original cleaner, one re.sub pass per rule"""
+    if not isinstance(text, str):
+        text = str(text)
+    text = text.lower()
+    text = re.sub(r'https?://\S+|www\.\S+', ' ', text)
+    text = re.sub(r'<.*?>', ' ', text)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = re.sub(r'\d+', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def word_tokenize(text):
+    # word_tokenize is sent_tokenize + NLTKWordTokenizer; clean_text output has no sentence punctuation,
+    # so the Punkt model (not always downloaded) would return the text as a single sentence
+    nltk_tokenize = pytest.importorskip('nltk.tokenize')
+    return nltk_tokenize.NLTKWordTokenizer().tokenize(text)
+
+
+def sample_texts():
+    with open(SAMPLE_PATH, 'r', encoding='utf-8') as f:
+        return [row['text'] for row in csv.DictReader(f)]
+
+
+def fuzzed_markup(n, seed=0):
+    """Random strings built from URL and tag fragments, where tag/URL overlap rules matter"""
+    rng = random.Random(seed)
+    fragments = ['http://', 'https://', 'www.', '<', '>', 'a', ' ', '\n', 'x', '1', '_', '/', '.', "'", '\u00e9']
+    return [''.join(rng.choice(fragments) for _ in range(rng.randint(0, 12))) for _ in range(n)]
+
+
+@pytest.mark.parametrize('text, expected', CLEAN_TEXT_GOLDEN)
+def test_clean_text_golden(text, expected):
+    assert clean_text(text) == expected
+    assert clean_text_chained(text) == expected
+
+
+def test_clean_text_matches_chained_cleaner():
+    texts = fuzzed_markup(20000) + sample_texts()
+    mismatches = [text for text, cleaned in zip(texts, clean_texts(texts)) if cleaned != clean_text_chained(text)]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize('text', TOKENIZER_CASES + [' '.join(TREEBANK_SPLITS)])
+def test_fast_tokenize_matches_word_tokenize(text):
+    cleaned_text = clean_text(text)
+    assert fast_tokenize(cleaned_text) == word_tokenize(cleaned_text)
+
+
+def test_fast_tokenize_matches_word_tokenize_on_sample_texts():
+    mismatches = [text for text in map(clean_text, sample_texts()) if fast_tokenize(text) != word_tokenize(text)]
+    assert mismatches == []
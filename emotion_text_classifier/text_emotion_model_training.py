@@ -10,7 +10,7 @@ Original file is located at
 """
 
 # Install required libraries
-!pip install nltk scikit-learn pandas numpy matplotlib seaborn
+!pip install nltk scikit-learn pandas pyarrow numpy matplotlib seaborn
 
 # Import libraries
 import pandas as pd
@@ -20,21 +20,32 @@ import re
 import nltk
 import matplotlib.pyplot as plt
 import seaborn as sns
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.model_selection import train_test_split, GridSearchCV, ParameterGrid, check_cv
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 from sklearn.pipeline import Pipeline
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from joblib import Parallel, delayed
 import os
 from google.colab import drive
 import time
+import hashlib
+import inspect
+import marshal
+import json
+import math
+import resource
+# Modules from this repository; upload them next to the notebook so they are importable
+from pipeline_metrics import pipeline_metrics
+from text_preprocessing import (MARKUP_RE, WORD_RE, TREEBANK_SPLITS, LemmaTable, clean_text, fast_tokenize,
+                                load_nltk_resources, preprocess_text, _preprocess_text_timed,
+                                parallel_preprocess_texts, preprocessing_cache)
+from emotion_predictor import EmotionPredictor, save_model
+from emotion_inference_engine import export_compact_model, verify_compact_model
 
 # Download necessary NLTK resources
-nltk.download('punkt')
-nltk.download('punkt_tab')
 nltk.download('stopwords')
 nltk.download('wordnet')
 
@@ -47,26 +58,73 @@ print("Libraries installed and resources loaded successfully!")
 
 """# **3: Load and Explore Data**"""
 
+def peak_memory_mb():
+    """Peak resident memory of this process so far (ru_maxrss is in KiB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def iter_csv_chunks(file_path, columns, chunk_size=100000):
+    """Yield DataFrame chunks of the given columns with emotion as a categorical, parsed by pyarrow when available"""
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        yield from pd.read_csv(file_path, usecols=columns, dtype={'text': str, 'emotion': 'category'},
+                               chunksize=chunk_size)
+        return
+    # Multithreaded streaming parse; emotion is dictionary-encoded, so it arrives as a categorical.
+    # strings_can_be_null treats empty and NA-like fields as nulls, as pd.read_csv does.
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=columns, strings_can_be_null=True,
+        column_types={'text': pa.string(), 'emotion': pa.dictionary(pa.int32(), pa.string())}
+    )
+    # pyarrow splits by bytes, not rows: size the blocks from the mean row length of the first megabyte
+    # so each chunk holds roughly chunk_size rows (more for small chunk sizes, as blocks are at least 1 MB)
+    with open(file_path, 'rb') as f:
+        sample = f.read(1 << 20)
+    row_bytes = len(sample) / max(sample.count(b'\n'), 1)
+    block_size = int(min(max(chunk_size * row_bytes, 1 << 20), 1 << 30))
+    reader = pa_csv.open_csv(file_path, read_options=pa_csv.ReadOptions(block_size=block_size),
+                             convert_options=convert_options)
+    for batch in reader:
+        yield batch.to_pandas()
+
 # Define data loading function with error handling
-def load_data(file_path):
+def load_data(file_path, chunk_size=100000):
     """Load the emotion dataset from Google Drive with validation"""
     try:
         print(f"Loading data from {file_path}...")
-        data = pd.read_csv(file_path)
+        start_time = time.time()
+        memory_before = peak_memory_mb()
 
-        # Validate data structure
+        # Validate data structure from the header before reading any rows
         required_columns = ['text', 'emotion']
-        missing_columns = [col for col in required_columns if col not in data.columns]
+        columns = pd.read_csv(file_path, nrows=0).columns
+        missing_columns = [col for col in required_columns if col not in columns]
         if missing_columns:
             raise ValueError(f"Data file missing required columns: {missing_columns}")
 
-        # Check for null values
-        null_counts = data[required_columns].isnull().sum()
+        # Check for null values chunk by chunk, keeping only the valid rows of each chunk
+        null_counts = pd.Series(0, index=required_columns)
+        texts, emotions = [], []
+        for chunk in iter_csv_chunks(file_path, required_columns, chunk_size):
+            chunk_nulls = chunk[required_columns].isnull().sum()
+            if chunk_nulls.any():
+                null_counts += chunk_nulls
+                chunk = chunk.dropna(subset=required_columns)
+            texts.append(chunk['text'])
+            emotions.append(chunk['emotion'].astype('category'))
         if null_counts.any():
             print(f"Warning: Found null values in the dataset:\n{null_counts}")
-            print("Removing rows with null values...")
-            data = data.dropna(subset=required_columns)
-
+            print("Removed rows with null values")
+
+        data = pd.DataFrame({
+            'text': pd.concat(texts, ignore_index=True) if texts else pd.Series([], dtype=object),
+            'emotion': pd.api.types.union_categoricals(emotions, sort_categories=True) if emotions
+                       else pd.Categorical([])
+        })
+        print(f"Loaded {len(data)} rows in {time.time() - start_time:.2f} seconds "
+              f"({data.memory_usage(deep=True).sum() / 2**20:.0f} MB in memory)")
+        print(f"Peak memory: {memory_before:.0f} MB before loading, {peak_memory_mb():.0f} MB after")
         return data
     except Exception as e:
         print(f"Error loading data: {str(e)}")
@@ -101,14 +159,14 @@ def explore_data(data):
     plt.savefig('/content/drive/My Drive/emotion_distribution.png')
     plt.show()
 
-    # Text length analysis
-    data['text_length'] = data['text'].apply(len)
+    # Text length analysis, without adding a column to the corpus frame
+    text_length = data['text'].str.len().astype(np.int32)
 
     print("\n--- Text Length Statistics ---")
-    print(data['text_length'].describe())
+    print(text_length.describe())
 
     plt.figure(figsize=(10, 6))
-    sns.boxplot(x='emotion', y='text_length', data=data)
+    sns.boxplot(x=data['emotion'], y=text_length)
     plt.title('Text Length by Emotion')
     plt.xlabel('Emotion')
     plt.ylabel('Text Length (characters)')
@@ -120,68 +178,113 @@ def explore_data(data):
     return emotion_counts
 
 emotion_counts = explore_data(data)
+print(f"Peak memory after exploration: {peak_memory_mb():.0f} MB")
 
 """# **4: Text Preprocessing**"""
 
-# Enhanced text cleaning function
-def clean_text(text):
-    """Clean text by removing special characters, extra spaces, and normalizing"""
-    if not isinstance(text, str):
-        text = str(text)
-
-    # Convert to lowercase
-    text = text.lower()
-
-    # Remove URLs
-    text = re.sub(r'https?://\S+|www\.\S+', ' ', text)
-
-    # Remove HTML tags
-    text = re.sub(r'<.*?>', ' ', text)
-
-    # Remove emojis and special characters
-    text = re.sub(r'[^\w\s]', ' ', text)
-
-    # Remove numbers
-    text = re.sub(r'\d+', ' ', text)
-
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-
-    return text
-
-# Enhanced text preprocessing function with caching
-lemmatizer = WordNetLemmatizer()
-eng_stopwords = set(stopwords.words('english'))
-preprocessing_cache = {}
-
-def preprocess_text(text):
-    """Preprocess text with tokenization, stopword removal, and lemmatization with caching"""
-    if text in preprocessing_cache:
-        return preprocessing_cache[text]
-
-    text = clean_text(text)
-    tokens = word_tokenize(text)
-    tokens = [token for token in tokens if token not in eng_stopwords]
-    tokens = [lemmatizer.lemmatize(token) for token in tokens]
-    processed_text = ' '.join(tokens)
-    preprocessing_cache[text] = processed_text
-    return processed_text
-
 # Improved data preprocessing function
-def preprocess_data(data):
+def preprocess_data(data, cache=None, lemma_table=None, n_workers=1, shard_size=20000):
     """Apply preprocessing to the dataset with progress tracking"""
+    cache = preprocessing_cache if cache is None else cache
     print("Preprocessing texts...")
     start_time = time.time()
-    data['processed_text'] = data['text'].apply(preprocess_text)
+    if n_workers is None or n_workers > 1:
+        # The worker results also fill this process's cache, which EmotionPredictor shares
+        data['processed_text'] = parallel_preprocess_texts(data['text'], n_workers, shard_size, lemma_table, cache)
+    else:
+        data['processed_text'] = data['text'].apply(preprocess_text, cache=cache, lemma_table=lemma_table)
+    print(f"Preprocessing cache: {cache.stats()}")
     emotion_mapping = {emotion: i for i, emotion in enumerate(sorted(data['emotion'].unique()))}
-    data['emotion_id'] = data['emotion'].map(emotion_mapping)
+    # Mapping a categorical returns a categorical; the labels are plain integers everywhere downstream
+    data['emotion_id'] = data['emotion'].map(emotion_mapping).astype(np.int64)
     end_time = time.time()
     print(f"Preprocessing completed in {end_time - start_time:.2f} seconds")
-    print(f"Vocabulary size (unique words): {len(set(' '.join(data['processed_text']).split()))}")
+    vocabulary_size, token_count = count_vocabulary(data['processed_text'])
+    print(f"Vocabulary size (unique words): {vocabulary_size} ({token_count} tokens)")
     return data, emotion_mapping
 
-# Preprocess the data
-data, emotion_mapping = preprocess_data(data)
+def count_vocabulary(texts):
+    """Count distinct and total whitespace tokens one text at a time instead of joining the corpus"""
+    vocabulary = set()
+    token_count = 0
+    for text in texts:
+        tokens = text.split()
+        vocabulary.update(tokens)
+        token_count += len(tokens)
+    return len(vocabulary), token_count
+
+# Persistent cache of the preprocessed corpus, keyed by input data and preprocessing code
+def file_content_hash(file_path, block_size=1 << 20):
+    """Compute a SHA-256 hash of a file's contents in fixed-size blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def preprocessing_fingerprint(lemma_table=None):
+    """Fingerprint the preprocessing code and resources so any rule change invalidates the cache.
+    A lemma table built from the data is covered by the LemmaTable code; a supplied one is hashed by content."""
+    digest = hashlib.sha256()
+    for func in (clean_text, fast_tokenize, preprocess_text, _preprocess_text_timed, LemmaTable, load_nltk_resources):
+        try:
+            digest.update(inspect.getsource(func).encode('utf-8'))
+        except (OSError, TypeError):
+            digest.update(marshal.dumps(func.__code__))
+    digest.update(' '.join(sorted(load_nltk_resources()['stopwords'])).encode('utf-8'))
+    digest.update(f'{MARKUP_RE.pattern} {WORD_RE.pattern}'.encode('utf-8'))
+    digest.update(repr(sorted(TREEBANK_SPLITS.items())).encode('utf-8'))
+    digest.update(nltk.__version__.encode('utf-8'))
+    if lemma_table is not None:
+        digest.update(pickle.dumps(sorted(lemma_table.table.items()), protocol=4))
+    return digest.hexdigest()
+
+def load_or_preprocess_data(data, file_path, cache_dir, lemma_table=None, **preprocess_kwargs):
+    """Reuse the cached processed_text/emotion_id columns, mapping and lemma table, or build, preprocess
+    and cache them. Without a lemma_table, one is only built from the corpus on a cache miss."""
+    cache_key = hashlib.sha256(
+        (file_content_hash(file_path) + preprocessing_fingerprint(lemma_table)).encode('utf-8')
+    ).hexdigest()[:16]
+    columns_path = os.path.join(cache_dir, f'preprocessed_{cache_key}.feather')
+    mapping_path = os.path.join(cache_dir, f'emotion_mapping_{cache_key}.pkl')
+    lemma_table_path = os.path.join(cache_dir, f'lemma_table_{cache_key}.pkl')
+
+    if all(os.path.exists(path) for path in (columns_path, mapping_path, lemma_table_path)):
+        try:
+            start_time = time.time()
+            cached = pd.read_feather(columns_path)
+            if len(cached) != len(data):
+                raise ValueError(f"cached rows ({len(cached)}) do not match data rows ({len(data)})")
+            with open(mapping_path, 'rb') as f:
+                emotion_mapping = pickle.load(f)
+            lemma_table = LemmaTable.load(lemma_table_path)
+            data['processed_text'] = cached['processed_text'].values
+            data['emotion_id'] = cached['emotion_id'].values
+            print(f"Loaded preprocessed corpus from cache {columns_path} in {time.time() - start_time:.2f} seconds")
+            return data, emotion_mapping, lemma_table
+        except Exception as e:
+            print(f"Ignoring unusable preprocessing cache: {str(e)}")
+
+    # Lemmatize each distinct token once; preprocessing (including forked workers) then looks tokens up
+    if lemma_table is None:
+        lemma_table = LemmaTable.build(data['text'])
+    data, emotion_mapping = preprocess_data(data, lemma_table=lemma_table, **preprocess_kwargs)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        data[['processed_text', 'emotion_id']].reset_index(drop=True).to_feather(columns_path)
+        with open(mapping_path, 'wb') as f:
+            pickle.dump(emotion_mapping, f)
+        lemma_table.save(lemma_table_path)
+        print(f"Preprocessed corpus cached to {columns_path}")
+    except Exception as e:
+        print(f"Error caching preprocessed corpus: {str(e)}")
+    return data, emotion_mapping, lemma_table
+
+# Preprocess the data, reusing the on-disk cache when the data and preprocessing are unchanged
+preprocessing_cache_dir = '/content/drive/My Drive/preprocessing_cache'
+data, emotion_mapping, corpus_lemma_table = load_or_preprocess_data(
+    data, data_path, preprocessing_cache_dir, n_workers=os.cpu_count()
+)
 
 # Show preprocessing results
 print("\nPreprocessing sample:")
@@ -192,8 +295,223 @@ print(f"Emotion: {data.iloc[sample_idx]['emotion']}")
 
 """# **5: Model Building and Training**"""
 
+# Grid search that fits each vectorizer configuration once per fold
+def _fit_and_score_classifier(classifier, params, X_train, y_train, X_val, y_val, scorer):
+    """Fit one classifier candidate on precomputed features and score it"""
+    start_time = time.time()
+    classifier = clone(classifier).set_params(**params)
+    classifier.fit(X_train, y_train)
+    return scorer(classifier, X_val, y_val), time.time() - start_time
+
+def _fit_fold_and_score(vectorizer, vectorizer_params, classifier, classifier_params, X_train, y_train, X_val, y_val,
+                        scorer):
+    """Fit one vectorizer configuration on a fold, then score every classifier setting on its features"""
+    start_time = time.time()
+    fold_vectorizer = clone(vectorizer).set_params(**vectorizer_params)
+    X_fold_train = fold_vectorizer.fit_transform(X_train)
+    X_fold_val = fold_vectorizer.transform(X_val)
+    vectorize_time = time.time() - start_time
+    results = [_fit_and_score_classifier(classifier, params, X_fold_train, y_train, X_fold_val, y_val, scorer)
+               for params in classifier_params]
+    return vectorize_time, results
+
+class CachedFeatureGridSearch:
+    """GridSearchCV-style search that reuses each fold's TF-IDF matrix across all classifier settings"""
+    def __init__(self, pipeline, param_grid, cv=3, scoring='accuracy', n_jobs=-1, verbose=1):
+        self.pipeline = pipeline
+        self.param_grid = param_grid
+        self.cv = cv
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+
+    def fit(self, X, y):
+        vectorizer_name, vectorizer = self.pipeline.steps[0]
+        classifier_name, classifier = self.pipeline.steps[-1]
+        vectorizer_prefix = f'{vectorizer_name}__'
+        classifier_prefix = f'{classifier_name}__'
+
+        X = pd.Series(X).reset_index(drop=True)
+        y = np.asarray(y)
+        folds = list(check_cv(self.cv, y, classifier=True).split(X, y))
+        candidates = list(ParameterGrid(self.param_grid))
+        scorer = get_scorer(self.scoring)
+
+        # Group candidates by their vectorizer settings so each group shares one feature matrix per fold
+        groups = {}
+        for index, params in enumerate(candidates):
+            vectorizer_params = {k[len(vectorizer_prefix):]: v for k, v in params.items() if k.startswith(vectorizer_prefix)}
+            groups.setdefault(repr(sorted(vectorizer_params.items())), (vectorizer_params, []))[1].append(index)
+
+        if self.verbose:
+            print(f"Fitting {len(folds)} folds for each of {len(candidates)} candidates, "
+                  f"reusing {len(groups)} vectorizer configurations")
+
+        # One task per (vectorizer configuration, fold): the vectorizer fits run in parallel and each
+        # task's feature matrix stays in its worker for all of that group's classifier settings
+        tasks = [(vectorizer_params, indices, fold) for vectorizer_params, indices in groups.values()
+                 for fold in range(len(folds))]
+        task_results = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fit_fold_and_score)(
+                vectorizer, vectorizer_params, classifier,
+                [{k[len(classifier_prefix):]: v for k, v in candidates[i].items() if k.startswith(classifier_prefix)}
+                 for i in indices],
+                X.iloc[folds[fold][0]], y[folds[fold][0]], X.iloc[folds[fold][1]], y[folds[fold][1]], scorer
+            )
+            for vectorizer_params, indices, fold in tasks
+        )
+
+        scores = np.zeros((len(candidates), len(folds)))
+        fit_times = np.zeros((len(candidates), len(folds)))
+        for (vectorizer_params, indices, fold), (vectorize_time, fold_results) in zip(tasks, task_results):
+            if pipeline_metrics.enabled:
+                pipeline_metrics.observe('grid_search.vectorize_fold', vectorize_time)
+            for i, (score, fit_time) in zip(indices, fold_results):
+                scores[i, fold] = score
+                fit_times[i, fold] = fit_time
+                if pipeline_metrics.enabled:
+                    pipeline_metrics.observe('grid_search.classifier_fit', fit_time)
+            if self.verbose:
+                print(f"  {vectorizer_params} fold {fold + 1}: vectorized in {vectorize_time:.2f} seconds, "
+                      f"{len(indices)} classifiers scored")
+
+        mean_scores = scores.mean(axis=1)
+        self.best_index_ = int(np.argmax(mean_scores))
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = mean_scores[self.best_index_]
+        self.cv_results_ = {
+            'params': candidates,
+            'mean_test_score': mean_scores,
+            'std_test_score': scores.std(axis=1),
+            'mean_fit_time': fit_times.mean(axis=1)
+        }
+        for fold in range(len(folds)):
+            self.cv_results_[f'split{fold}_test_score'] = scores[:, fold]
+
+        self.best_estimator_ = clone(self.pipeline).set_params(**self.best_params_)
+        self.best_estimator_.fit(X, y)
+        return self
+
+# Successive halving over training-set size with a resumable checkpoint
+def _fit_and_score_pipeline(pipeline, params, X_train, y_train, X_val, y_val, scorer):
+    """Fit one full pipeline candidate on a training subset and score it"""
+    start_time = time.time()
+    estimator = clone(pipeline).set_params(**params)
+    estimator.fit(X_train, y_train)
+    return scorer(estimator, X_val, y_val), time.time() - start_time
+
+class SuccessiveHalvingSearch:
+    """Successive-halving search that checkpoints every (round, candidate, fold) score to disk"""
+    def __init__(self, pipeline, param_grid, cv=3, scoring='accuracy', factor=3,
+                 checkpoint_path=None, n_jobs=-1, verbose=1, random_state=42):
+        self.pipeline = pipeline
+        self.param_grid = param_grid
+        self.cv = cv
+        self.scoring = scoring
+        self.factor = factor
+        self.checkpoint_path = checkpoint_path
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+        self.random_state = random_state
+
+    def _search_key(self, candidates, X, y):
+        # Checkpoint records only count for the same grid, data and schedule
+        digest = hashlib.sha256()
+        digest.update(pd.util.hash_pandas_object(X, index=False).values.tobytes())
+        digest.update(pd.util.hash_pandas_object(pd.Series(y), index=False).values.tobytes())
+        spec = repr((candidates, len(X), self.cv, self.scoring, self.factor, self.random_state))
+        digest.update(spec.encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _load_checkpoint(self, search_key):
+        completed = {}
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A partially written last line from an interrupted run
+                    if record.get('search_key') == search_key:
+                        completed[(record['round'], record['candidate'], record['fold'])] = record
+            print(f"Resuming search with {len(completed)} completed fits from {self.checkpoint_path}")
+        return completed
+
+    def fit(self, X, y):
+        X = pd.Series(X).reset_index(drop=True)
+        y = np.asarray(y)
+        candidates = list(ParameterGrid(self.param_grid))
+        folds = list(check_cv(self.cv, y, classifier=True).split(X, y))
+        scorer = get_scorer(self.scoring)
+        rng = np.random.RandomState(self.random_state)
+        fold_orders = [rng.permutation(train_idx) for train_idx, _ in folds]
+
+        max_resources = min(len(order) for order in fold_orders)
+        n_rounds = 1 + int(math.floor(math.log(len(candidates), self.factor))) if len(candidates) > 1 else 1
+        search_key = self._search_key(candidates, X, y)
+        completed = self._load_checkpoint(search_key)
+        checkpoint = open(self.checkpoint_path, 'a', encoding='utf-8') if self.checkpoint_path else None
+
+        alive = list(range(len(candidates)))
+        fit_times = np.zeros(len(candidates))
+        last_scores = {}
+        try:
+            for round_index in range(n_rounds):
+                n_resources = int(max_resources // self.factor ** (n_rounds - 1 - round_index))
+                if self.verbose:
+                    print(f"Round {round_index + 1}/{n_rounds}: {len(alive)} candidates, "
+                          f"{n_resources} training samples per fold")
+
+                pending = [(c, fold) for c in alive for fold in range(len(folds))
+                           if (round_index, c, fold) not in completed]
+                results = Parallel(n_jobs=self.n_jobs, return_as='generator')(
+                    delayed(_fit_and_score_pipeline)(
+                        self.pipeline, candidates[c],
+                        X.iloc[fold_orders[fold][:n_resources]], y[fold_orders[fold][:n_resources]],
+                        X.iloc[folds[fold][1]], y[folds[fold][1]], scorer
+                    )
+                    for c, fold in pending
+                )
+                for (c, fold), (score, fit_time) in zip(pending, results):
+                    record = {'search_key': search_key, 'round': round_index, 'candidate': c, 'fold': fold,
+                              'n_resources': n_resources, 'score': score, 'fit_time': fit_time}
+                    completed[(round_index, c, fold)] = record
+                    if checkpoint:
+                        checkpoint.write(json.dumps(record) + '\n')
+                        checkpoint.flush()
+
+                round_scores = {}
+                for c in alive:
+                    records = [completed[(round_index, c, fold)] for fold in range(len(folds))]
+                    round_scores[c] = np.mean([r['score'] for r in records])
+                    fit_times[c] += sum(r['fit_time'] for r in records)
+                last_scores.update({c: (round_index, score) for c, score in round_scores.items()})
+
+                if round_index < n_rounds - 1:
+                    n_keep = max(1, int(math.ceil(len(alive) / self.factor)))
+                    alive = sorted(alive, key=lambda c: (-round_scores[c], c))[:n_keep]
+        finally:
+            if checkpoint:
+                checkpoint.close()
+
+        self.best_index_ = max(alive, key=lambda c: (last_scores[c][1], -c))
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = last_scores[self.best_index_][1]
+        self.timing_table_ = pd.DataFrame([
+            {'candidate': c, 'rounds': last_scores[c][0] + 1, 'last_mean_score': last_scores[c][1],
+             'total_fit_time': fit_times[c], **candidates[c]}
+            for c in range(len(candidates))
+        ]).sort_values(['rounds', 'last_mean_score'], ascending=False)
+        if self.verbose:
+            print("\nPer-candidate timing:")
+            print(self.timing_table_.to_string(index=False))
+
+        self.best_estimator_ = clone(self.pipeline).set_params(**self.best_params_)
+        self.best_estimator_.fit(X, y)
+        return self
+
 # Define model building function with hyperparameter tuning
-def build_model(data, emotion_mapping):
+def build_model(data, emotion_mapping, search_mode='cached', checkpoint_path=None):
     """Build, train, and evaluate the emotion classification model with hyperparameter tuning"""
     X_train, X_test, y_train, y_test = train_test_split(
         data['processed_text'], data['emotion_id'],
@@ -222,21 +540,40 @@ def build_model(data, emotion_mapping):
     }
 
     print("Performing grid search for hyperparameter tuning...")
-    grid_search = GridSearchCV(
-        pipeline, param_grid, cv=3,
-        scoring='accuracy', verbose=1, n_jobs=-1
-    )
+    if search_mode == 'halving':
+        grid_search = SuccessiveHalvingSearch(
+            pipeline, param_grid, cv=3, scoring='accuracy', factor=3,
+            checkpoint_path=checkpoint_path, n_jobs=-1, verbose=1
+        )
+    elif search_mode == 'cached':
+        grid_search = CachedFeatureGridSearch(
+            pipeline, param_grid, cv=3,
+            scoring='accuracy', verbose=1, n_jobs=-1
+        )
+    else:
+        grid_search = GridSearchCV(
+            pipeline, param_grid, cv=3,
+            scoring='accuracy', verbose=1, n_jobs=-1
+        )
 
     start_time = time.time()
     grid_search.fit(X_train, y_train)
     end_time = time.time()
     print(f"Model training completed in {end_time - start_time:.2f} seconds")
+    if pipeline_metrics.enabled:
+        pipeline_metrics.observe('build_model.search', end_time - start_time)
 
     best_model = grid_search.best_estimator_
     print(f"Best hyperparameters: {grid_search.best_params_}")
 
     print("Evaluating model on test set...")
-    y_pred = best_model.predict(X_test)
+    start_time = time.time()
+    # One predict_proba for the test set: labels are its argmax, and analyze_errors reuses the matrix
+    probs = best_model.predict_proba(X_test)
+    y_pred = best_model.classes_[probs.argmax(axis=1)]
+    if pipeline_metrics.enabled:
+        pipeline_metrics.observe('build_model.predict_test', time.time() - start_time)
+        pipeline_metrics.observe_batch('build_model.predict_test', len(X_test))
 
     id_to_emotion = {v: k for k, v in emotion_mapping.items()}
     y_test_labels = [id_to_emotion[i] for i in y_test]
@@ -261,94 +598,144 @@ def build_model(data, emotion_mapping):
     plt.savefig('/content/drive/My Drive/confusion_matrix.png')
     plt.show()
 
-    return best_model, X_test, y_test, y_test_labels, y_pred_labels, report
+    return best_model, X_test, y_test, y_test_labels, y_pred_labels, report, probs
 
 # Build and train the model
-model, X_test, y_test, y_test_labels, y_pred_labels, classification_report_text = build_model(data, emotion_mapping)
+model, X_test, y_test, y_test_labels, y_pred_labels, classification_report_text, test_probs = build_model(
+    data, emotion_mapping)
 
 """# **6: Error Analysis**"""
 
-def analyze_errors(X_test, y_test_labels, y_pred_labels, model, emotion_mapping):
-    """Perform detailed error analysis"""
-    misclassified_indices = [i for i, (y_true, y_pred) in enumerate(zip(y_test_labels, y_pred_labels)) if y_true != y_pred]
-
-    if not misclassified_indices:
-        print("No misclassifications found!")
-        return
-
-    X_test_series = pd.Series(X_test.values)
-    sample_size = min(10, len(misclassified_indices))
-    sampled_indices = np.random.choice(misclassified_indices, sample_size, replace=False)
-
-    error_df = pd.DataFrame({
-        'Text': [X_test_series.iloc[idx] for idx in sampled_indices],
-        'True_Emotion': [y_test_labels[idx] for idx in sampled_indices],
-        'Predicted_Emotion': [y_pred_labels[idx] for idx in sampled_indices]
-    })
-
+def analyze_errors(X_test, y_test_labels, y_pred_labels, model, emotion_mapping, probs=None, top_k=3,
+                   sample_size=10, low_margin=0.1, n_bins=10, output_dir='/content/drive/My Drive'):
+    """Perform detailed error analysis over every misclassification from one batched predict_proba matrix"""
+    texts = np.asarray(X_test, dtype=object)
+    if probs is None:
+        probs = model.predict_proba(X_test)
     id_to_emotion = {v: k for k, v in emotion_mapping.items()}
-    for idx, row_idx in enumerate(sampled_indices):
-        text = X_test_series.iloc[row_idx]
-        probs = model.predict_proba([text])[0]
-        emotion_probs = {id_to_emotion[i]: prob for i, prob in enumerate(probs)}
-        top_emotions = sorted(emotion_probs.items(), key=lambda x: x[1], reverse=True)[:3]
-        for i, (emotion, prob) in enumerate(top_emotions):
-            error_df.at[idx, f'Top{i+1}'] = emotion
-            error_df.at[idx, f'Prob{i+1}'] = f"{prob:.3f}"
+    class_emotions = np.array([id_to_emotion[c] for c in model.classes_], dtype=object)
+    emotion_to_column = {emotion: column for column, emotion in enumerate(class_emotions)}
+    n_classes = len(class_emotions)
+
+    true_idx = pd.Series(y_test_labels).map(emotion_to_column).to_numpy(dtype=np.int64)
+    pred_idx = pd.Series(y_pred_labels).map(emotion_to_column).to_numpy(dtype=np.int64)
+    rows = np.arange(len(probs))
+    confidence = probs[rows, pred_idx]
+    runner_up = np.partition(probs, -2, axis=1)[:, -2] if n_classes > 1 else np.zeros(len(probs))
+    margin = probs.max(axis=1) - runner_up
+    is_error = true_idx != pred_idx
+    error_rows = np.flatnonzero(is_error)
+
+    if len(error_rows) == 0:
+        print("No misclassifications found!")
+        return None
 
     print("\n--- Error Analysis ---")
-    print(f"Total misclassifications: {len(misclassified_indices)} out of {len(y_test_labels)} ({len(misclassified_indices)/len(y_test_labels)*100:.2f}%)")
-
-    confusion_pairs = {}
-    for idx in misclassified_indices:
-        pair = (y_test_labels[idx], y_pred_labels[idx])
-        confusion_pairs[pair] = confusion_pairs.get(pair, 0) + 1
+    print(f"Total misclassifications: {len(error_rows)} out of {len(y_test_labels)} ({len(error_rows)/len(y_test_labels)*100:.2f}%)")
+
+    # Confusion pairs: one bincount over true * n_classes + predicted ids of all errors
+    pair_counts = np.bincount(true_idx[error_rows] * n_classes + pred_idx[error_rows],
+                              minlength=n_classes * n_classes)
+    pair_order = np.argsort(-pair_counts, kind='stable')
+    pair_order = pair_order[pair_counts[pair_order] > 0]
+    pairs_df = pd.DataFrame({
+        'True_Emotion': class_emotions[pair_order // n_classes],
+        'Predicted_Emotion': class_emotions[pair_order % n_classes],
+        'Count': pair_counts[pair_order],
+        'Share_Of_Errors': pair_counts[pair_order] / len(error_rows)
+    })
 
     print("\nTop confusion pairs (True -> Predicted):")
-    for (true, pred), count in sorted(confusion_pairs.items(), key=lambda x: x[1], reverse=True)[:5]:
-        print(f"  {true} -> {pred}: {count} instances")
+    for row in pairs_df.head(5).itertuples(index=False):
+        print(f"  {row.True_Emotion} -> {row.Predicted_Emotion}: {row.Count} instances")
+
+    # Top-k alternatives for every error: argpartition, then sort only the k winners
+    error_probs = probs[error_rows]
+    k = min(top_k, n_classes)
+    top_columns = np.argpartition(-error_probs, k - 1, axis=1)[:, :k]
+    top_probs = np.take_along_axis(error_probs, top_columns, axis=1)
+    order = np.argsort(-top_probs, axis=1, kind='stable')
+    top_columns = np.take_along_axis(top_columns, order, axis=1)
+    top_probs = np.take_along_axis(top_probs, order, axis=1)
+
+    error_df = pd.DataFrame({
+        'Text': texts[error_rows],
+        'True_Emotion': class_emotions[true_idx[error_rows]],
+        'Predicted_Emotion': class_emotions[pred_idx[error_rows]],
+    })
+    for i in range(k):
+        error_df[f'Top{i+1}'] = class_emotions[top_columns[:, i]]
+        error_df[f'Prob{i+1}'] = top_probs[:, i]
+    error_df['Margin'] = margin[error_rows]
+    error_df['True_Prob'] = error_probs[np.arange(len(error_rows)), true_idx[error_rows]]
+
+    # Per-class statistics over the whole test set: calibration of each predicted class, errors of each true class
+    def per_class(index, weights=None):
+        return np.bincount(index, weights=weights, minlength=n_classes)
+    predicted_count = per_class(pred_idx)
+    predicted_correct = per_class(pred_idx, ~is_error)
+    true_count = per_class(true_idx)
+    true_errors = per_class(true_idx[error_rows])
+    low_margin_errors = per_class(true_idx[error_rows], margin[error_rows] < low_margin)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        class_df = pd.DataFrame({
+            'Emotion': class_emotions,
+            'Support': true_count.astype(int),
+            'Errors': true_errors.astype(int),
+            'Error_Rate': true_errors / true_count,
+            'Mean_True_Prob_On_Errors': per_class(true_idx[error_rows], error_df['True_Prob'].to_numpy()) / true_errors,
+            'Low_Margin_Errors': low_margin_errors.astype(int),
+            'Predicted': predicted_count.astype(int),
+            'Precision': predicted_correct / predicted_count,
+            'Mean_Confidence': per_class(pred_idx, confidence) / predicted_count,
+        })
+    class_df['Calibration_Gap'] = class_df['Mean_Confidence'] - class_df['Precision']
+
+    # Reliability bins over all predictions, and the expected calibration error
+    bins = np.minimum((confidence * n_bins).astype(np.int64), n_bins - 1)
+    bin_count = np.bincount(bins, minlength=n_bins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        calibration_df = pd.DataFrame({
+            'Confidence_From': np.arange(n_bins) / n_bins,
+            'Confidence_To': np.arange(1, n_bins + 1) / n_bins,
+            'Count': bin_count,
+            'Mean_Confidence': np.bincount(bins, weights=confidence, minlength=n_bins) / bin_count,
+            'Accuracy': np.bincount(bins, weights=~is_error, minlength=n_bins) / bin_count
+        })
+    ece = float(np.nansum(bin_count / len(bins) * np.abs(calibration_df['Mean_Confidence'] - calibration_df['Accuracy'])))
+
+    error_margin = margin[error_rows]
+    print(f"\nErrors with margin < {low_margin}: {(error_margin < low_margin).sum()} "
+          f"({(error_margin < low_margin).mean():.1%}); median error margin {np.median(error_margin):.3f}")
+    print(f"Correct predictions with margin < {low_margin}: {(margin[~is_error] < low_margin).sum()}")
+    print(f"Expected calibration error: {ece:.4f}")
+    print("\nPer-class error and calibration statistics:")
+    print(class_df.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
 
     print("\nSample of misclassified texts:")
-    for _, row in error_df.iterrows():
+    sampled = error_df.sample(n=min(sample_size, len(error_df)))
+    for _, row in sampled.iterrows():
         print(f"\nText: {row['Text']}")
         print(f"True emotion: {row['True_Emotion']}")
-        print(f"Predicted emotion: {row['Predicted_Emotion']} (confidence: {row['Prob1']})")
-        print(f"Top alternatives: {row['Top2']} ({row['Prob2']}), {row['Top3']} ({row['Prob3']})")
+        print(f"Predicted emotion: {row['Predicted_Emotion']} (confidence: {row['Prob1']:.3f})")
+        alternatives = ', '.join(f"{row[f'Top{i+1}']} ({row[f'Prob{i+1}']:.3f})" for i in range(1, k))
+        print(f"Top alternatives: {alternatives}")
         print("-" * 50)
 
-    error_df.to_csv('/content/drive/My Drive/error_analysis.csv', index=False)
-    print("Error analysis saved to Google Drive as 'error_analysis.csv'")
+    error_df.to_csv(os.path.join(output_dir, 'error_analysis.csv'), index=False, float_format='%.3f')
+    pairs_df.to_csv(os.path.join(output_dir, 'error_confusion_pairs.csv'), index=False, float_format='%.4f')
+    class_df.to_csv(os.path.join(output_dir, 'error_class_stats.csv'), index=False, float_format='%.4f')
+    calibration_df.to_csv(os.path.join(output_dir, 'error_calibration.csv'), index=False, float_format='%.4f')
+    print(f"Error analysis of all {len(error_df)} misclassifications saved to Google Drive as 'error_analysis.csv' "
+          f"(with error_confusion_pairs.csv, error_class_stats.csv and error_calibration.csv)")
+    return {'errors': error_df, 'confusion_pairs': pairs_df, 'class_stats': class_df,
+            'calibration': calibration_df, 'expected_calibration_error': ece}
 
 # Run error analysis
-analyze_errors(X_test, y_test_labels, y_pred_labels, model, emotion_mapping)
+analyze_errors(X_test, y_test_labels, y_pred_labels, model, emotion_mapping, probs=test_probs)
 
 """# **7: Save Model and Results**"""
 
-def save_model(model, emotion_mapping, model_path, mapping_path, report, report_path):
-    """Save the trained model, emotion mapping, and classification report with versioning"""
-    try:
-        os.makedirs(os.path.dirname(model_path), exist_ok=True)
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        model_path = model_path.replace('.pkl', f'_{timestamp}.pkl')
-        mapping_path = mapping_path.replace('.pkl', f'_{timestamp}.pkl')
-        report_path = report_path.replace('.txt', f'_{timestamp}.txt')
-
-        with open(model_path, 'wb') as f:
-            pickle.dump(model, f)
-        with open(mapping_path, 'wb') as f:
-            pickle.dump(emotion_mapping, f)
-        with open(report_path, 'w') as f:
-            f.write(report)
-
-        print(f"Model saved to {model_path}")
-        print(f"Emotion mapping saved to {mapping_path}")
-        print(f"Classification report saved to {report_path}")
-        return model_path, mapping_path, report_path
-
-    except Exception as e:
-        print(f"Error saving model: {str(e)}")
-        raise
-
 # Define paths for saving
 model_path = '/content/drive/My Drive/emotion_model.pkl'
 mapping_path = '/content/drive/My Drive/emotion_mapping.pkl'
@@ -356,93 +743,47 @@ report_path = '/content/drive/My Drive/classification_report.txt'
 
 # Save everything
 saved_model_path, saved_mapping_path, saved_report_path = save_model(
-    model, emotion_mapping, model_path, mapping_path, classification_report_text, report_path
+    model, emotion_mapping, model_path, mapping_path, classification_report_text, report_path,
+    lemma_table=corpus_lemma_table
 )
 
-"""# **8: Prediction Function and Testing**"""
-
-class EmotionPredictor:
-    """A class for making emotion predictions with confidence scores"""
-    def __init__(self, model, emotion_mapping):
-        self.model = model
-        self.emotion_mapping = emotion_mapping
-        self.id_to_emotion = {v: k for k, v in emotion_mapping.items()}
-
-    def predict(self, text):
-        """Predict emotion from text"""
-        processed_text = preprocess_text(text)
-        emotion_id = self.model.predict([processed_text])[0]
-        emotion = self.id_to_emotion[emotion_id]
-        probs = self.model.predict_proba([processed_text])[0]
-        emotion_probs = {self.id_to_emotion[i]: prob for i, prob in enumerate(probs)}
-        sorted_probs = sorted(emotion_probs.items(), key=lambda x: x[1], reverse=True)
-        confidence = emotion_probs[emotion]
-        margin = confidence - sorted_probs[1][1] if len(sorted_probs) > 1 else confidence
-        return {
-            'emotion': emotion,
-            'confidence': confidence,
-            'margin': margin,
-            'probabilities': emotion_probs,
-            'processed_text': processed_text
-        }
+# Export the compact, memory-mappable model format used by the diary app and inference tools
+compact_model_dir = '/content/drive/My Drive/emotion_model_compact'
+# The timestamped pickle name doubles as the model version the diary app records when re-scoring entries
+model_version = os.path.splitext(os.path.basename(saved_model_path))[0]
+export_compact_model(model, emotion_mapping, compact_model_dir, model_version=model_version)
+max_diff = verify_compact_model(model, compact_model_dir, X_test.iloc[:5000])
+print(f"Compact model exported to {compact_model_dir} (max predict_proba difference: {max_diff:.2e})")
 
-    def predict_batch(self, texts):
-        """Process a batch of texts and predict emotions"""
-        results = []
-        for text in texts:
-            if text:
-                result = self.predict(text)
-                result['text'] = text
-                results.append(result)
-        return results
-
-    def predict_from_file(self, file_path):
-        """Process a file with multiple text samples"""
-        texts = []
-        try:
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-                if 'text' in df.columns:
-                    texts = df['text'].tolist()
-                else:
-                    texts = df.iloc[:, 0].tolist()
-            else:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    texts = [line.strip() for line in file if line.strip()]
-        except Exception as e:
-            print(f"Error reading file: {str(e)}")
-            return []
-        return self.predict_batch(texts)
+"""# **8: Prediction Function and Testing**"""
 
 # Create predictor
-predictor = EmotionPredictor(model, emotion_mapping)
+predictor = EmotionPredictor(model, emotion_mapping, lemma_table=corpus_lemma_table)
 
 # Test with a file
 file_path = "/content/drive/MyDrive/dataset/test.csv"
 
 try:
     print(f"\nProcessing samples from {file_path}...")
-    results = predictor.predict_from_file(file_path)
-    print(f"Processed {len(results)} samples from file:")
-
-    results_df = pd.DataFrame(results)
-    results_df['top_emotions'] = results_df['probabilities'].apply(
-        lambda x: ', '.join([f"{e}: {p:.3f}" for e, p in sorted(x.items(), key=lambda i: i[1], reverse=True)[:3]])
-    )
+    results_path = '/content/drive/My Drive/prediction_results.csv'
+    total_rows = predictor.predict_file_streaming(file_path, results_path, chunk_size=10000)
+    print(f"Processed {total_rows} samples from file:")
 
-    display_df = results_df[['text', 'emotion', 'confidence', 'top_emotions']]
+    display_df = pd.read_csv(results_path, nrows=5)
 
-    for i, row in display_df.head(5).iterrows():
+    for i, row in display_df.iterrows():
         print(f"\nSample {i+1}:")
         print(f"Text: {row['text']}")
         print(f"Predicted emotion: {row['emotion']} (confidence: {row['confidence']:.3f})")
         print(f"Top emotions: {row['top_emotions']}")
 
-    results_path = '/content/drive/My Drive/prediction_results.csv'
-    display_df.to_csv(results_path, index=False)
     print(f"\nAll results saved to {results_path}")
 
 except Exception as e:
     print(f"Error during prediction: {str(e)}")
 
+if pipeline_metrics.enabled:
+    pipeline_metrics.log_summary()
+    pipeline_metrics.dump_prometheus('/content/drive/My Drive/pipeline_metrics.prom')
+
 print("\nEmotion classification pipeline completed successfully!")
\ No newline at end of file
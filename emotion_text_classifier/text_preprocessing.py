@@ -0,0 +1,297 @@
+"""Text preprocessing shared by the training script, the inference engine and the tools"""
+import os
+import re
+import time
+import pickle
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from pipeline_metrics import pipeline_metrics
+
+# URLs and HTML tags in one pass. A URL inside a tag is consumed whole (the lookahead/backreference makes it
+# atomic), so a '>' within it does not close the tag, exactly as when URLs are removed before tags.
+URL_PATTERN = r'(?:https?://|www\.)\S+'
+MARKUP_RE = re.compile(URL_PATTERN + r'|<(?:(?=(' + URL_PATTERN + r'))\1|(?!(?:https?://|www\.)\S)[^>\n])*?>')
+# Special characters, digits and whitespace all become separators, so the cleaned text is
+# just the runs of non-digit word characters joined by single spaces
+WORD_RE = re.compile(r'[^\W\d]+')
+
+
+def clean_text(text):
+    """Clean text by removing URLs, HTML tags, special characters, numbers and extra spaces"""
+    if not isinstance(text, str):
+        text = str(text)
+    text = text.lower()
+    if '<' in text or '://' in text or 'www.' in text:
+        text = MARKUP_RE.sub(' ', text)
+    return ' '.join(WORD_RE.findall(text))
+
+
+def clean_texts(texts):
+    """clean_text over an iterable of texts, as a list"""
+    return [clean_text(text) for text in texts]
+
+
+# On clean_text output (lower-case \w runs separated by single spaces) word_tokenize only ever splits
+# these Treebank contractions, so a whitespace split plus this table reproduces it token for token
+TREEBANK_SPLITS = {
+    'cannot': ['can', 'not'], 'gimme': ['gim', 'me'], 'gonna': ['gon', 'na'],
+    'gotta': ['got', 'ta'], 'lemme': ['lem', 'me'], 'wanna': ['wan', 'na']
+}
+
+
+def fast_tokenize(cleaned_text):
+    """word_tokenize-equivalent tokenizer for clean_text output"""
+    tokens = cleaned_text.split()
+    if TREEBANK_SPLITS.keys().isdisjoint(tokens):
+        return tokens
+    split_tokens = []
+    for token in tokens:
+        split_tokens.extend(TREEBANK_SPLITS.get(token, (token,)))
+    return split_tokens
+
+
+# NLTK is only imported the first time a text needs the WordNet path or a lemma table is built,
+# so the inference engine stays light to import
+_nltk_resources = {}
+
+
+def load_nltk_resources():
+    """English stopwords and a WordNetLemmatizer, loaded once per process"""
+    if not _nltk_resources:
+        from nltk.corpus import stopwords
+        from nltk.stem import WordNetLemmatizer
+        _nltk_resources['stopwords'] = set(stopwords.words('english'))
+        _nltk_resources['lemmatizer'] = WordNetLemmatizer()
+    return _nltk_resources
+
+
+# Bounded LRU cache for preprocessed texts, keyed on the raw input text
+class PreprocessingCache:
+    """LRU cache mapping raw texts to preprocessed texts with hit/miss/eviction counters"""
+    def __init__(self, max_size=100000, hash_keys=False):
+        self.max_size = max_size
+        self.hash_keys = hash_keys
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, text):
+        # Hashing replaces long raw texts with a fixed 16-byte digest to cap key memory
+        if self.hash_keys:
+            return hashlib.blake2b(str(text).encode('utf-8'), digest_size=16).digest()
+        return text
+
+    def get(self, text):
+        key = self._key(text)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, text, processed_text):
+        if self.max_size <= 0:
+            return
+        key = self._key(text)
+        self._entries[key] = processed_text
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+# Shared by preprocess_text, EmotionPredictor and preprocess_data unless a cache is passed in
+preprocessing_cache = PreprocessingCache(max_size=100000)
+
+
+# The corpus has tens of thousands of distinct tokens but millions of occurrences, so stopword
+# filtering and lemmatization are precomputed once per token and become a dict lookup per occurrence
+class LemmaTable:
+    """Token -> lemma lookup with stopwords mapped to DROP; unseen tokens fall back to WordNet and are memoized"""
+    DROP = ''
+    FORMAT_VERSION = 1
+
+    def __init__(self, table):
+        self.table = dict(table)
+        self.fallbacks = 0
+
+    @classmethod
+    def build(cls, texts):
+        """Build the table from the vocabulary of the cleaned, tokenized texts plus every stopword"""
+        start_time = time.time()
+        lemma_table = cls({token: cls.DROP for token in load_nltk_resources()['stopwords']})
+        n_added = lemma_table.update(texts)
+        print(f"Lemma table built: {len(lemma_table.table)} tokens ({n_added} new from the corpus) "
+              f"in {time.time() - start_time:.2f} seconds")
+        return lemma_table
+
+    def _lemmatize(self, token):
+        resources = load_nltk_resources()
+        return self.DROP if token in resources['stopwords'] else resources['lemmatizer'].lemmatize(token)
+
+    def update(self, texts):
+        """Add the tokens of the cleaned, tokenized texts that are not in the table yet; returns how many"""
+        vocabulary = set()
+        for cleaned_text in clean_texts(texts):
+            vocabulary.update(fast_tokenize(cleaned_text))
+        new_tokens = vocabulary.difference(self.table)
+        for token in new_tokens:
+            self.table[token] = self._lemmatize(token)
+        return len(new_tokens)
+
+    def lemmatize_tokens(self, tokens):
+        """Drop stopwords and lemmatize the rest, equivalent to the per-token stopword test and lemmatize call"""
+        table = self.table
+        lemmas = [table.get(token) for token in tokens]
+        if None in lemmas:
+            for i, token in enumerate(tokens):
+                if lemmas[i] is None:
+                    lemma = table.get(token)
+                    if lemma is None:
+                        lemma = table[token] = self._lemmatize(token)
+                        self.fallbacks += 1
+                    lemmas[i] = lemma
+        return [lemma for lemma in lemmas if lemma]
+
+    def save(self, path):
+        """Pickle the table as plain builtins"""
+        with open(path, 'wb') as f:
+            pickle.dump({'format_version': self.FORMAT_VERSION, 'drop': self.DROP, 'table': self.table}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+        if payload.get('format_version') != cls.FORMAT_VERSION or payload.get('drop') != cls.DROP:
+            raise ValueError(f"Unsupported lemma table format in {path}")
+        return cls(payload['table'])
+
+
+def preprocess_text(text, cache=None, lemma_table=None):
+    """Preprocess text with tokenization, stopword removal, and lemmatization with caching.
+    Without a lemma_table every token goes through the stopword set and WordNet."""
+    cache = preprocessing_cache if cache is None else cache
+    processed_text = cache.get(text)
+    if pipeline_metrics.enabled:
+        return _preprocess_text_timed(text, cache, processed_text, lemma_table)
+    if processed_text is not None:
+        return processed_text
+
+    tokens = fast_tokenize(clean_text(text))
+    if lemma_table is not None:
+        tokens = lemma_table.lemmatize_tokens(tokens)
+    else:
+        resources = load_nltk_resources()
+        tokens = [token for token in tokens if token not in resources['stopwords']]
+        tokens = [resources['lemmatizer'].lemmatize(token) for token in tokens]
+    processed_text = ' '.join(tokens)
+    cache.put(text, processed_text)
+    return processed_text
+
+
+def _preprocess_text_timed(text, cache, cached_text, lemma_table=None):
+    """preprocess_text with per-stage timings and cache hit/miss counts recorded in pipeline_metrics"""
+    if cached_text is not None:
+        pipeline_metrics.increment('preprocess_text.cache_hits')
+        return cached_text
+    pipeline_metrics.increment('preprocess_text.cache_misses')
+
+    start = time.perf_counter()
+    cleaned_text = clean_text(text)
+    after_clean = time.perf_counter()
+    tokens = fast_tokenize(cleaned_text)
+    after_tokenize = time.perf_counter()
+    if lemma_table is not None:
+        tokens = lemma_table.lemmatize_tokens(tokens)
+        after_stopwords = after_lemmatize = time.perf_counter()
+        pipeline_metrics.observe('preprocess.lemma_lookup', after_lemmatize - after_tokenize)
+    else:
+        resources = load_nltk_resources()
+        tokens = [token for token in tokens if token not in resources['stopwords']]
+        after_stopwords = time.perf_counter()
+        tokens = [resources['lemmatizer'].lemmatize(token) for token in tokens]
+        after_lemmatize = time.perf_counter()
+        pipeline_metrics.observe('preprocess.stopword_filter', after_stopwords - after_tokenize)
+        pipeline_metrics.observe('preprocess.lemmatize', after_lemmatize - after_stopwords)
+    processed_text = ' '.join(tokens)
+    cache.put(text, processed_text)
+
+    pipeline_metrics.observe('preprocess.clean_text', after_clean - start)
+    pipeline_metrics.observe('preprocess.tokenize', after_tokenize - after_clean)
+    pipeline_metrics.observe('preprocess_text', time.perf_counter() - start)
+    return processed_text
+
+
+# Parallel preprocessing: shard the texts across a process pool
+_worker_lemma_table = None
+
+
+def _init_preprocessing_worker(lemma_table):
+    """Set up the lemma table and a worker-local cache once per worker process"""
+    global _worker_lemma_table, preprocessing_cache
+    _worker_lemma_table = lemma_table
+    # A forked worker starts with a copy of the parent's metrics; only its own observations are sent back
+    pipeline_metrics.reset()
+    if lemma_table is None:
+        # Load the WordNet corpus once instead of on the first shard
+        load_nltk_resources()['lemmatizer'].lemmatize('warmup')
+    preprocessing_cache = PreprocessingCache(max_size=100000)
+
+
+def _preprocess_shard(shard):
+    """Preprocess one (shard_index, texts) shard and return its results with timing and, when enabled,
+    the metrics recorded for it"""
+    shard_index, texts = shard
+    start_time = time.time()
+    processed = [preprocess_text(text, lemma_table=_worker_lemma_table) for text in texts]
+    metrics = pipeline_metrics.drain() if pipeline_metrics.enabled else None
+    return shard_index, processed, time.time() - start_time, metrics
+
+
+def parallel_preprocess_texts(texts, n_workers=None, shard_size=20000, lemma_table=None, cache=None):
+    """Preprocess texts across a process pool, returning results in the original order.
+    Workers use their own caches; the results are added to cache when one is given."""
+    texts = list(texts)
+    n_workers = n_workers or os.cpu_count() or 1
+    shards = [(i, texts[start:start + shard_size])
+              for i, start in enumerate(range(0, len(texts), shard_size))]
+
+    # Fork hands the lemma table to the workers without pickling it
+    start_methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in start_methods else None)
+
+    results = [None] * len(shards)
+    with context.Pool(processes=n_workers, initializer=_init_preprocessing_worker,
+                      initargs=(lemma_table,)) as pool:
+        for shard_index, processed, elapsed, metrics in pool.imap_unordered(_preprocess_shard, shards):
+            results[shard_index] = processed
+            if metrics is not None:
+                pipeline_metrics.merge(metrics)
+            print(f"  Shard {shard_index + 1}/{len(shards)}: {len(processed)} texts in {elapsed:.2f} seconds")
+
+    processed_texts = [text for shard in results for text in shard]
+    if cache is not None:
+        for text, processed_text in zip(texts, processed_texts):
+            cache.put(text, processed_text)
+    return processed_texts